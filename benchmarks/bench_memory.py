@@ -0,0 +1,93 @@
+"""
+Peak-RSS benchmark for process_annotations: default mode vs compact=True.
+
+Generates a synthetic input of N rows plus a prior output that already covers
+every row, so the run only loads the input, builds the resume set and walks
+the indices (no network calls).  Each mode runs in its own subprocess so the
+peak RSS is measured independently.
+
+    python benchmarks/bench_memory.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def _peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 返回 KB，macOS 返回字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _synthetic_smiles(rng, i):
+    ring = rng.choice(["C1=CC=CC=C1", "C1CCOC1", "C1=CC(=O)OC2=CC=CC=C12", "N1C=CC=C1"])
+    return f"{ring}C(=O)O{'C' * (i % 7)}N{i}"
+
+
+def make_inputs(rows, out_dir, seed=0):
+    """Write a synthetic input table and a prior output covering all rows."""
+    rng = random.Random(seed)
+    in_path = os.path.join(out_dir, f"input_{rows}.csv")
+    out_path = os.path.join(out_dir, f"output_{rows}.csv")
+    with open(in_path, "w", encoding="utf-8") as fin, open(out_path, "w", encoding="utf-8-sig") as fout:
+        fin.write("Herb,Ingredient Pubchem CID,SMILES\n")
+        fout.write("CID,SMILES,Name,Description\n")
+        for i in range(rows):
+            smi = _synthetic_smiles(rng, i)
+            fin.write(f"herb{i % 500},{i + 1},{smi}\n")
+            fout.write(f"{i + 1},{smi},compound {i},synthetic description for compound {i}\n")
+    return in_path, out_path
+
+
+def _child(args):
+    from src.pubchem import process_annotations
+    baseline = _peak_rss_bytes()
+    process_annotations(args.input, cid_name="Ingredient Pubchem CID", smiles_name="SMILES",
+                        out_path=args.output, delay=0, compact=args.mode == "compact")
+    print(json.dumps({"baseline": baseline, "peak": _peak_rss_bytes()}))
+
+
+def run_mode(mode, in_path, out_path):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode,
+           "--input", in_path, "--output", out_path]
+    res = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak RSS per million rows: default vs compact mode.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workdir", default=None, help="目录（默认临时目录）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["default", "compact"], default="default")
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args)
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as d:
+        in_path, out_path = make_inputs(args.rows, d)
+        print(f"rows: {args.rows:,}")
+        print(f"{'mode':<10}{'peak RSS (MB)':>16}{'above imports (MB)':>20}{'MB / 1M rows':>16}")
+        for mode in ("default", "compact"):
+            r = run_mode(mode, in_path, out_path)
+            peak_mb = r["peak"] / 2 ** 20
+            delta_mb = (r["peak"] - r["baseline"]) / 2 ** 20
+            print(f"{mode:<10}{peak_mb:>16.1f}{delta_mb:>20.1f}{delta_mb * 1e6 / args.rows:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Deterministic fixtures for the benchmarks: pug_view-shaped compound records of
+various sizes and synthetic result files of 10k to 10M rows.
+"""
+import json
+import os
+import random
+
+# 每个档位：(顶层 section 数, 每个 section 的子 section 数, 嵌套深度)
+RECORD_SIZES = {
+    "small": (4, 2, 2),      # ~ 20 sections
+    "medium": (12, 4, 3),    # ~ 250 sections
+    "large": (16, 6, 4),     # ~ 4000 sections
+}
+
+HEADINGS = ["Names and Identifiers", "Chemical and Physical Properties", "Spectral Information",
+            "Related Records", "Pharmacology and Biochemistry", "Safety and Hazards", "Toxicity",
+            "Literature", "Patents", "Taxonomy", "Classification"]
+
+SMILES_PARTS = ["C1=CC=CC=C1", "C1CCOC1", "C1=CC(=O)OC2=CC=CC=C12", "N1C=CC=C1", "CC(=O)O", "OC", "[C@H]", "Cl"]
+
+
+def _markup_value(rng, words=40):
+    text = " ".join(rng.choice(["compound", "acid", "reported", "in", "with", "data", "available", "is", "a",
+                                "member", "of", "flavonoids", "natural", "product", "found"])
+                    for _ in range(words))
+    return {"StringWithMarkup": [{"String": text.capitalize() + ".",
+                                  "Markup": [{"Start": 0, "Length": 8, "URL": "https://pubchem.ncbi.nlm.nih.gov/",
+                                              "Type": "PubChem Internal Link"}]}]}
+
+
+def _information(rng, n):
+    infos = []
+    for k in range(n):
+        if k % 3 == 2:
+            value = {"Number": [rng.random() * 100], "Unit": "g/mol"}
+        else:
+            value = _markup_value(rng)
+        infos.append({"ReferenceNumber": rng.randint(1, 500), "Name": "Value", "Value": value})
+    return infos
+
+
+def _section(rng, heading, fanout, depth):
+    sec = {"TOCHeading": heading, "Description": f"{heading} section", "Information": _information(rng, 3)}
+    if depth > 1:
+        sec["Section"] = [_section(rng, f"{rng.choice(HEADINGS)} {d}", fanout, depth - 1) for d in range(fanout)]
+    return sec
+
+
+def make_record(size="medium", seed=0):
+    """Build a pug_view compound record of the given size with one Record Description."""
+    top, fanout, depth = RECORD_SIZES[size]
+    rng = random.Random(seed)
+    sections = [_section(rng, HEADINGS[t % len(HEADINGS)], fanout, depth) for t in range(top)]
+    # 真实记录里 Record Description 位于 Names and Identifiers 之下
+    rd = {"TOCHeading": "Record Description", "Description": "Summary",
+          "Information": [{"ReferenceNumber": 1, "Name": "Record Description", "Value": _markup_value(rng, 60)}
+                          for _ in range(3)]}
+    sections[0].setdefault("Section", []).insert(0, rd)
+    return {"Record": {"RecordType": "CID", "RecordNumber": 5280343, "RecordTitle": "Quercetin",
+                       "Section": sections}}
+
+
+def record_nbytes(record):
+    return len(json.dumps(record).encode("utf-8"))
+
+
+def make_smiles(n, seed=0):
+    """n synthetic SMILES strings, some quoted / with stray whitespace like real inputs."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        smi = "".join(rng.choice(SMILES_PARTS) for _ in range(rng.randint(2, 6))) + f"N{i}"
+        r = rng.random()
+        if r < 0.1:
+            smi = f'"{smi}"'
+        elif r < 0.2:
+            smi = f" {smi}\t"
+        out.append(smi)
+    return out
+
+
+def make_output_file(path, rows, seed=0):
+    """Synthetic result CSV (CID, SMILES, Name, Description) with ``rows`` rows; reused if present."""
+    if os.path.exists(path):
+        return path
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8-sig") as f:
+        f.write("CID,SMILES,Name,Description\n")
+        for i in range(rows):
+            smi = "".join(rng.choice(SMILES_PARTS) for _ in range(rng.randint(2, 6))) + f"N{i}"
+            f.write(f'{i + 1},{smi},compound {i},"Compound {i} is a natural product, reported in herb {i % 997}."\n')
+    os.replace(tmp, path)
+    return path
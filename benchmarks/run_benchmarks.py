@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks for the CPU-side hot paths of src/pubchem.py.
+
+    python benchmarks/run_benchmarks.py                                  # 运行并打印
+    python benchmarks/run_benchmarks.py --save benchmarks/baseline.json  # 保存基线
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json --fail-on-regression
+
+Cases:
+  find_sections / extract_texts_from_data   pug_view 记录（small / medium / large）
+  norm_smi / clean_smiles                   10k 个 SMILES 字符串
+  resume_set[default|compact]               从已有输出构建续跑集合（--sizes 行，10k ~ 10M）
+  append_csv                                _append_df_to_csv 临时文件 + 追加写
+
+Each case is timed with timeit (autorange, then --repeat repetitions); the
+median and minimum time per call are reported.  --compare prints the ratio of
+the minimum times against a stored baseline and flags cases slower by more
+than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, ".."))
+for p in (ROOT, HERE):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import numpy as np
+import pandas as pd
+
+import fixtures
+from src import pubchem
+
+DEFAULT_SIZES = [10_000, 100_000]
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a case; the decorated function gets the run context and returns a zero-arg callable."""
+    def deco(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+    return deco
+
+
+for _size in fixtures.RECORD_SIZES:
+    def _find(ctx, size=_size):
+        sections = fixtures.make_record(size)["Record"]["Section"]
+        return lambda: pubchem.find_sections(sections, target="Record Description")
+
+    def _extract(ctx, size=_size):
+        sections = fixtures.make_record(size)["Record"]["Section"]
+        return lambda: pubchem.extract_texts_from_data(sections)
+
+    benchmark(f"find_sections[{_size}]")(_find)
+    benchmark(f"extract_texts_from_data[{_size}]")(_extract)
+
+
+@benchmark("norm_smi[10k]")
+def _norm(ctx):
+    smiles = fixtures.make_smiles(10_000)
+    return lambda: [pubchem._norm_smi(s) for s in smiles]
+
+
+@benchmark("clean_smiles[10k]")
+def _clean(ctx):
+    smiles = fixtures.make_smiles(10_000)
+    return lambda: [pubchem._clean_smiles(s) for s in smiles]
+
+
+def _resume_case(mode, rows):
+    def setup(ctx):
+        path = fixtures.make_output_file(os.path.join(ctx["workdir"], f"output_{rows}.csv"), rows)
+        return lambda: pubchem._load_processed(path, compact=(mode == "compact"))
+    return setup
+
+
+@benchmark("append_csv[20 rows]")
+def _append(ctx):
+    out = os.path.join(ctx["tmpdir"], "append.csv")
+    df = pd.DataFrame({"CID": np.arange(20), "SMILES": fixtures.make_smiles(20),
+                       "Name": ["name"] * 20, "Description": ["description " * 10] * 20})
+    pubchem._append_df_to_csv(out, df, header=True)
+    return lambda: pubchem._append_df_to_csv(out, df, header=False)
+
+
+def register_resume_cases(sizes):
+    for rows in sizes:
+        for mode in ("default", "compact"):
+            benchmark(f"resume_set[{mode},{rows}]")(_resume_case(mode, rows))
+
+
+def time_case(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"median": statistics.median(times), "min": min(times), "number": number, "repeat": repeat}
+
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(),
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+
+def _fmt(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def compare(current, baseline, threshold):
+    """Print a comparison table; returns the names of regressed cases."""
+    regressions = []
+    print(f"\n{'case (min)':<40}{'baseline':>14}{'current':>14}{'ratio':>9}  status")
+    for name, res in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40}{'-':>14}{_fmt(res['min']):>14}{'-':>9}  new")
+            continue
+        # 比较最小值：受系统噪声影响最小
+        ratio = res["min"] / base["min"]
+        status = "REGRESSION" if ratio > 1 + threshold else ("faster" if ratio < 1 - threshold else "ok")
+        if status == "REGRESSION":
+            regressions.append(name)
+        print(f"{name:<40}{_fmt(base['min']):>14}{_fmt(res['min']):>14}{ratio:>8.2f}x  {status}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the hot in-process code paths.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="resume_set 的输出文件行数，逗号分隔（如 10000,100000,1000000,10000000）")
+    parser.add_argument("--filter", default=None, help="只运行名字包含该子串的用例")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", default=os.path.join(HERE, ".data"), help="合成数据缓存目录")
+    parser.add_argument("--save", default=None, help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", default=None, help="与基线 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="比基线慢超过该比例视为回归")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有回归时以非零状态退出")
+    args = parser.parse_args(argv)
+
+    register_resume_cases([int(s) for s in args.sizes.split(",") if s.strip()])
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ctx = {"workdir": args.workdir, "tmpdir": tmpdir}
+        print(f"{'case':<40}{'median':>14}{'min':>14}{'loops':>8}")
+        for name, setup in BENCHMARKS:
+            if args.filter and args.filter not in name:
+                continue
+            res = time_case(setup(ctx), args.repeat)
+            results[name] = res
+            print(f"{name:<40}{_fmt(res['median']):>14}{_fmt(res['min']):>14}{res['number']:>8}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "machine": machine_info(),
+                       "results": results}, f, indent=4)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.compare} ({baseline.get('created')}, {baseline.get('machine', {}).get('platform')})")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
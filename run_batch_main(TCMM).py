@@ -16,6 +16,10 @@ parser.add_argument("--save-every", type=int, default=20)
 parser.add_argument("--max-rows", type=int, default=None)
 parser.add_argument("--sample", action="store_true")
 parser.add_argument("--batch-start", type=int, default=None)
+parser.add_argument("--manifest", default=None, help="运行清单路径（增量运行，只请求新增/变更的行）")
+parser.add_argument("--checkpoint", default="checkpoints/state(TCMM).json", help="checkpoint 路径（每次写盘及中断时更新）")
+parser.add_argument("--grace", type=float, default=30, help="收到 SIGINT/SIGTERM 后等待在途请求的秒数")
+parser.add_argument("--description-store", default=None, help="本地 CID→description store（python -m src.harvest 生成）")
 parser.add_argument("--verbose", action="store_true")
 args = parser.parse_args()
 
@@ -44,5 +48,9 @@ process_annotations(
     max_rows=args.max_rows,
     sample=args.sample,
     batch_start=args.batch_start,
+    manifest_path=args.manifest,
+    checkpoint_path=args.checkpoint,
+    grace_period=args.grace,
+    description_store=args.description_store,
     verbose=args.verbose
 )
\ No newline at end of file
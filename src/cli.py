@@ -1,6 +1,14 @@
 import argparse
+import os
 import sys
-from processor import BatchProcessor
+
+# 以脚本方式运行（python src/cli.py）时把项目根加入 sys.path，按包导入
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.config import CHECKPOINT_FILE
+from src.processor import BatchProcessor
 
 def main():
     parser = argparse.ArgumentParser(description="Batch process PubChem annotations.")
@@ -32,6 +40,14 @@ def main():
         '--resume', action='store_true',
         help='If set, resume from the last checkpoint.'
     )
+    parser.add_argument(
+        '--checkpoint', type=str, default=CHECKPOINT_FILE,
+        help='Path to the checkpoint file written on save and on interruption.'
+    )
+    parser.add_argument(
+        '--grace', type=float, default=30,
+        help='Seconds to wait for the in-flight request after SIGINT/SIGTERM before aborting it.'
+    )
     parser.add_argument(
         '--verbose', action='store_true',
         help='If set, print detailed logs during processing.'
@@ -47,7 +63,9 @@ def main():
         max_rows=args.max_rows,
         sample=args.sample,
         resume=args.resume,
-        verbose=args.verbose
+        verbose=args.verbose,
+        checkpoint_path=args.checkpoint,
+        grace_period=args.grace
     )
 
     try:
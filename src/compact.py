@@ -0,0 +1,251 @@
+"""
+Output compaction: dedupe result files and write a CID-sorted output + index.
+
+    python -m src.compact output/merged.csv output/a.csv output/b.jsonl --keep longest
+
+Inputs (CSV / JSONL / Parquet) are streamed in chunks; each chunk is sorted
+by (CID, normalized SMILES) and spilled to a temporary run file, and the runs
+are k-way merged (external sort), so memory is bounded by ``chunksize``
+regardless of the total size.  Rows with the same CID and normalized SMILES
+are collapsed according to ``keep``:
+
+  first    第一次出现的行（按输入文件顺序、行顺序）
+  last     最后一次出现的行
+  longest  Description 最长的行（相同时取第一次出现）
+
+Next to the output a ``<out>.idx`` CSV (CID, offset, rows) is written, with
+the byte offset of the first row of every CID; ``lookup()`` uses it to read
+the rows of one CID without scanning the file.
+"""
+import argparse
+import csv
+import heapq
+import io
+import itertools
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .pubchem import _norm_smi, _detect_smi_col
+
+KEEP_POLICIES = ("first", "last", "longest")
+OUTPUT_COLUMNS = ["CID", "SMILES", "Name", "Description"]
+_MISSING_CID = 2 ** 63 - 1  # 无 CID 的行排在最后
+
+
+def _raise_field_limit():
+    limit = sys.maxsize
+    while True:
+        try:
+            csv.field_size_limit(limit)
+            return
+        except OverflowError:
+            limit //= 10
+
+
+def _pick_col(columns, name):
+    for c in columns:
+        if str(c).strip().lower() == name.lower():
+            return c
+    return None
+
+
+def _iter_chunks(path, chunksize):
+    """按块读取结果文件（CSV / JSONL / Parquet），统一成 OUTPUT_COLUMNS。"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        chunks = pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+    elif ext in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("读取 Parquet 需要安装 pyarrow（pip install pyarrow）。")
+        chunks = (b.to_pandas() for b in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    else:
+        chunks = pd.read_csv(path, encoding='utf-8-sig', dtype=str, chunksize=chunksize)
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        cols = {
+            "CID": _pick_col(chunk.columns, "CID"),
+            "SMILES": _detect_smi_col(chunk.columns),
+            "Name": _pick_col(chunk.columns, "Name"),
+            "Description": _pick_col(chunk.columns, "Description"),
+        }
+        out = pd.DataFrame({k: (chunk[c] if c is not None else None) for k, c in cols.items()})
+        yield out
+
+
+def _cid_key(cid):
+    if cid is None:
+        return _MISSING_CID
+    try:
+        if pd.isna(cid):
+            return _MISSING_CID
+        return int(float(str(cid).strip()))
+    except (TypeError, ValueError):
+        return _MISSING_CID
+
+
+def _text(v):
+    if v is None:
+        return ""
+    try:
+        if pd.isna(v):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(v)
+
+
+def _write_run(rows, tmp_dir):
+    rows.sort(key=lambda r: (r[0], r[1], r[2]))
+    fd, path = tempfile.mkstemp(dir=tmp_dir, prefix="run_", suffix=".csv")
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for r in csv.reader(f):
+            yield (int(r[0]), r[1], int(r[2]), r[3], r[4], r[5], r[6])
+
+
+def _merge_runs(runs, tmp_dir, fan_in):
+    """多路归并，直到剩下的 run 数不超过 fan_in。"""
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i:i + fan_in]
+            fd, path = tempfile.mkstemp(dir=tmp_dir, prefix="run_", suffix=".csv")
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows(heapq.merge(*(_read_run(p) for p in group),
+                                                    key=lambda r: (r[0], r[1], r[2])))
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        runs = merged
+    return runs
+
+
+def _resolve(group, keep):
+    if keep == "first":
+        return group[0]
+    if keep == "last":
+        return group[-1]
+    return max(group, key=lambda r: (len(r[6]), -r[2]))
+
+
+def compact_results(inputs, out_path, keep="first", chunksize=200_000, fan_in=64,
+                    tmp_dir=None, verbose=False):
+    """
+    Dedupe result files by (CID, normalized SMILES) and write a CID-sorted CSV
+    plus a ``<out>.idx`` lookup index.  返回 (输入行数, 输出行数)。
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"keep must be one of {KEEP_POLICIES}, got {keep!r}")
+    _raise_field_limit()
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+
+    n_in = 0
+    with tempfile.TemporaryDirectory(dir=tmp_dir or out_dir, prefix="._compact_") as work:
+        # 1) 分块排序，写出有序 run
+        runs = []
+        seq = itertools.count()
+        for path in inputs:
+            for chunk in _iter_chunks(path, chunksize):
+                rows = []
+                for cid, smi, name, desc in chunk.itertuples(index=False, name=None):
+                    nsmi = _norm_smi(smi)
+                    if not nsmi:
+                        continue
+                    rows.append((_cid_key(cid), nsmi, next(seq), _text(cid), nsmi, _text(name), _text(desc)))
+                n_in += len(rows)
+                if rows:
+                    runs.append(_write_run(rows, work))
+            if verbose:
+                print(f"已读取 {path}，累计 {n_in} 行，{len(runs)} 个 run。")
+
+        # 2) 归并 + 去重，写输出和索引
+        runs = _merge_runs(runs, work, fan_in)
+        merged = heapq.merge(*(_read_run(p) for p in runs), key=lambda r: (r[0], r[1], r[2]))
+        n_out = 0
+        tmp_out = out_path + ".compacting"
+        tmp_idx = out_path + ".idx.compacting"
+        with open(tmp_out, 'wb') as out, open(tmp_idx, 'w', encoding='utf-8', newline='') as idx:
+            idx_writer = csv.writer(idx)
+            idx_writer.writerow(["CID", "offset", "rows"])
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            writer.writerow(OUTPUT_COLUMNS)
+            out.write(buf.getvalue().encode('utf-8-sig'))
+            cur_cid, cur_offset, cur_rows = None, 0, 0
+            for _, group in itertools.groupby(merged, key=lambda r: (r[0], r[1])):
+                r = _resolve(list(group), keep)
+                cid_key = r[0]
+                if cid_key != cur_cid:
+                    if cur_cid is not None and cur_cid != _MISSING_CID:
+                        idx_writer.writerow([cur_cid, cur_offset, cur_rows])
+                    cur_cid, cur_offset, cur_rows = cid_key, out.tell(), 0
+                buf.seek(0)
+                buf.truncate()
+                writer.writerow([r[3] if cid_key == _MISSING_CID else cid_key, r[4], r[5], r[6]])
+                out.write(buf.getvalue().encode('utf-8'))
+                cur_rows += 1
+                n_out += 1
+            if cur_cid is not None and cur_cid != _MISSING_CID:
+                idx_writer.writerow([cur_cid, cur_offset, cur_rows])
+        os.replace(tmp_out, out_path)
+        os.replace(tmp_idx, out_path + ".idx")
+
+    print(f"压缩完成：输入 {n_in} 行，输出 {n_out} 行（去重 {n_in - n_out}）-> {out_path}")
+    return n_in, n_out
+
+
+class CidIndex:
+    """Lookup of rows by CID in a compacted output via its ``.idx`` file."""
+
+    def __init__(self, out_path):
+        self.out_path = out_path
+        idx = pd.read_csv(out_path + ".idx", dtype="int64")
+        self._cids = idx["CID"].to_numpy()
+        self._offsets = idx["offset"].to_numpy()
+        self._rows = idx["rows"].to_numpy()
+
+    def lookup(self, cid):
+        """返回该 CID 的所有行（dict 列表），不存在时返回空列表。"""
+        _raise_field_limit()
+        key = _cid_key(cid)
+        pos = int(np.searchsorted(self._cids, key))
+        if pos >= len(self._cids) or self._cids[pos] != key:
+            return []
+        with open(self.out_path, 'rb') as f:
+            f.seek(int(self._offsets[pos]))
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+            return [dict(zip(OUTPUT_COLUMNS, row)) for row in itertools.islice(reader, int(self._rows[pos]))]
+
+
+def lookup(out_path, cid):
+    return CidIndex(out_path).lookup(cid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dedupe result files into a CID-sorted output with a lookup index.")
+    parser.add_argument("out", help="输出 CSV 路径（同时写出 <out>.idx）")
+    parser.add_argument("inputs", nargs="+", help="结果文件（CSV / JSONL / Parquet）")
+    parser.add_argument("--keep", choices=KEEP_POLICIES, default="first", help="重复行的取舍规则")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="每个排序块的行数（决定内存上限）")
+    parser.add_argument("--tmp-dir", default=None, help="临时 run 文件目录（默认输出目录）")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    compact_results(args.inputs, args.out, keep=args.keep, chunksize=args.chunksize,
+                    tmp_dir=args.tmp_dir, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
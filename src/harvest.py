@@ -0,0 +1,181 @@
+"""
+Bulk harvest of Record Description annotations into a local CID store.
+
+    python -m src.harvest --store data/record_descriptions.sqlite --delay 0.2
+
+Instead of one pug_view request per compound, PUG-View serves every
+annotation under a heading in pages::
+
+    /rest/pug_view/annotations/heading/Record%20Description/JSON?heading_type=Compound&page=N
+
+The pages are downloaded (resumable: finished pages are recorded in the store
+in the same transaction as their rows) into a SQLite CID -> (name,
+description) table.  ``process_annotations(description_store=...)`` then only
+calls the per-CID endpoints for compounds the store does not cover.
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+from .pubchem import RateLimiter, extract_texts_from_data
+
+ANNOTATIONS_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/annotations/heading/{heading}/JSON"
+HEADING = "Record Description"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptions (cid INTEGER PRIMARY KEY, name TEXT, description TEXT, source TEXT);
+CREATE TABLE IF NOT EXISTS pages (heading TEXT, page INTEGER, annotations INTEGER, fetched_at REAL,
+                                  PRIMARY KEY (heading, page));
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class DescriptionStore:
+    """Local CID -> (name, description) store; thread-safe lookups."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, cid):
+        """返回 (name, description)，store 中没有该 CID 时返回 None。"""
+        try:
+            key = int(cid)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            row = self.conn.execute("SELECT name, description FROM descriptions WHERE cid = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def done_pages(self, heading=HEADING):
+        return {r[0] for r in self.conn.execute("SELECT page FROM pages WHERE heading = ?", (heading,))}
+
+    def total_pages(self, heading=HEADING):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (f"total_pages:{heading}",)).fetchone()
+        return int(row[0]) if row else None
+
+    def save_page(self, heading, page, total_pages, rows):
+        """一页的结果和页码在同一事务里写入，中断后可按页续跑。"""
+        with self._lock, self.conn:
+            # 同一 CID 多个来源时保留先收录的
+            self.conn.executemany("INSERT OR IGNORE INTO descriptions (cid, name, description, source) "
+                                  "VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO pages (heading, page, annotations, fetched_at) "
+                              "VALUES (?, ?, ?, ?)", (heading, page, len(rows), time.time()))
+            if total_pages is not None:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                  (f"total_pages:{heading}", str(total_pages)))
+
+
+def parse_annotation_page(data):
+    """
+    Parse one annotations page.  返回 (rows, total_pages)，
+    rows 为 (cid, name, description, source) 列表。
+    """
+    block = data.get("Annotations", {}) or {}
+    rows = []
+    for ann in block.get("Annotation", []) or []:
+        cids = (ann.get("LinkedRecords") or {}).get("CID") or []
+        texts = extract_texts_from_data(ann.get("Data") or [])
+        if not cids or not texts:
+            continue
+        desc = "\n".join(texts[:6])
+        for cid in cids:
+            rows.append((int(cid), ann.get("Name"), desc, ann.get("SourceName")))
+    total = block.get("TotalPages")
+    return rows, (int(total) if total is not None else None)
+
+
+def fetch_annotation_page(page, heading=HEADING, retries=3, backoff=1.5, verbose=False):
+    """Fetch one page of annotations; returns the parsed JSON or None."""
+    url = ANNOTATIONS_URL.format(heading=quote(heading))
+    params = {"heading_type": "Compound", "page": page}
+    headers = {"User-Agent": "python-requests/1.0 (contact: none)"}
+    for attempt in range(1, retries + 1):
+        try:
+            r = requests.get(url, params=params, timeout=60, headers=headers)
+            if verbose:
+                print(f"GET {r.url} -> {r.status_code}")
+            if r.status_code == 200:
+                return r.json()
+            if r.status_code == 404:
+                return None
+        except Exception as e:
+            if verbose:
+                print(f"annotations page {page} 请求异常: {e}")
+        if attempt < retries:
+            time.sleep(min(backoff ** attempt + random.random(), 5))
+    return None
+
+
+def harvest_descriptions(store_path, heading=HEADING, delay=0.2, max_pages=None, limiter=None, verbose=False):
+    """
+    Download all annotation pages of ``heading`` into the store, skipping
+    pages that are already there.  返回本次新下载的页数。
+    """
+    store = DescriptionStore(store_path)
+    limiter = limiter or RateLimiter(delay)
+    fetched = 0
+    try:
+        done = store.done_pages(heading)
+        total = store.total_pages(heading)
+        page = 1
+        while total is None or page <= total:
+            if max_pages is not None and fetched >= max_pages:
+                break
+            if page in done:
+                page += 1
+                continue
+            limiter.wait()
+            data = fetch_annotation_page(page, heading=heading, verbose=verbose)
+            if data is None:
+                print(f"第 {page} 页下载失败，稍后重新运行即可续跑。", file=sys.stderr)
+                break
+            rows, total_pages = parse_annotation_page(data)
+            total = total_pages or total or page
+            store.save_page(heading, page, total, rows)
+            fetched += 1
+            if verbose or page % 50 == 0:
+                print(f"page {page}/{total}: {len(rows)} CID 注释，store 共 {len(store)} 个 CID")
+            page += 1
+        remaining = (total or 0) - len(store.done_pages(heading))
+        print(f"本次下载 {fetched} 页，剩余 {max(remaining, 0)} 页；store 共 {len(store)} 个 CID -> {store_path}")
+    finally:
+        store.close()
+    return fetched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harvest PubChem Record Description annotations into a local store.")
+    parser.add_argument("--store", required=True, help="CID→description store（SQLite）路径")
+    parser.add_argument("--heading", default=HEADING)
+    parser.add_argument("--delay", type=float, default=0.2, help="相邻两次请求的最小间隔（秒）")
+    parser.add_argument("--max-pages", type=int, default=None, help="本次最多下载多少页")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    harvest_descriptions(args.store, heading=args.heading, delay=args.delay, max_pages=args.max_pages,
+                         verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
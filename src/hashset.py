@@ -0,0 +1,70 @@
+"""
+Compact membership set of 64-bit string hashes.
+
+Used by ``process_annotations(compact=True)`` instead of a Python ``set`` of
+full SMILES strings: one uint64 per identifier in a sorted NumPy array, plus a
+small pending set for recent additions that is merged in periodically.
+"""
+import numpy as np
+import pandas as pd
+
+
+def hash64(values):
+    """64-bit hashes of an iterable/array of strings (vectorized)."""
+    arr = np.asarray(values, dtype=object)
+    if arr.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_array(arr.astype(str).astype(object), categorize=False)
+
+
+def hash_one(value):
+    return int(hash64([value])[0])
+
+
+class HashedSet:
+    """Set of strings stored as a sorted ``np.uint64`` array of their hashes."""
+
+    def __init__(self, values=None, merge_every=65536):
+        self._sorted = np.empty(0, dtype=np.uint64)
+        self._pending = set()
+        self.merge_every = merge_every
+        if values is not None:
+            self.update(values)
+
+    def update(self, values):
+        hashes = hash64(values)
+        if hashes.size:
+            self._sorted = np.union1d(self._sorted, hashes)
+
+    def add(self, value):
+        h = hash_one(value)
+        if not self._contains_hash(h):
+            self._pending.add(h)
+            if len(self._pending) >= self.merge_every:
+                self._merge()
+
+    def __ior__(self, other):
+        self.update(list(other))
+        return self
+
+    def _merge(self):
+        if self._pending:
+            pending = np.fromiter(self._pending, dtype=np.uint64, count=len(self._pending))
+            self._sorted = np.union1d(self._sorted, pending)
+            self._pending = set()
+
+    def _contains_hash(self, h):
+        if h in self._pending:
+            return True
+        pos = np.searchsorted(self._sorted, np.uint64(h))
+        return bool(pos < self._sorted.size and self._sorted[pos] == h)
+
+    def __contains__(self, value):
+        return self._contains_hash(hash_one(value))
+
+    def __len__(self):
+        return int(self._sorted.size) + len(self._pending)
+
+    @property
+    def nbytes(self):
+        return int(self._sorted.nbytes) + 8 * len(self._pending)
@@ -0,0 +1,338 @@
+"""
+Multi-node work distribution via a lease-based SQLite job table.
+
+    python -m src.jobs init  --db /shared/jobs.sqlite --file data/inputs/x.csv --smiles SMILES
+    python -m src.jobs work  --db /shared/jobs.sqlite          # 每台机器启动一个或多个
+    python -m src.jobs status --db /shared/jobs.sqlite
+    python -m src.jobs merge --db /shared/jobs.sqlite --out output/x_annotation.csv
+
+The coordinator (init) loads the de-duplicated input into a job table split
+into fixed-size batches.  Workers claim a batch with a time-limited lease,
+renew it while working, write the batch to its own shard file and mark it
+done.  Leases that expire (crashed / preempted worker) are handed out again.
+merge concatenates the shards of finished batches into one output CSV.
+
+The database must live on a filesystem with working POSIX locks (SQLite
+default rollback journal; WAL does not work over network filesystems).
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from . import pubchem
+from .pubchem import _read_table, _find_col, _norm_smi, RateLimiter, CidMemo
+from .shutdown import GracefulShutdown
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS rows (idx INTEGER PRIMARY KEY, smiles TEXT NOT NULL, cid TEXT);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id INTEGER PRIMARY KEY,
+    start_idx INTEGER NOT NULL,
+    end_idx INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    shard TEXT
+);
+CREATE INDEX IF NOT EXISTS batches_status ON batches (status, lease_expires);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobTable:
+    """Lease-based batch queue stored in a SQLite file."""
+
+    def __init__(self, db_path, timeout=60):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @property
+    def shard_dir(self):
+        return self._meta("shard_dir")
+
+    def load(self, smiles, cids=None, batch_size=500, shard_dir=None, source=None):
+        """Fill an empty job table with rows and fixed-size batches."""
+        if self.conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]:
+            raise RuntimeError(f"任务表 {self.db_path} 已初始化，请换一个路径。")
+        if shard_dir is None:
+            shard_dir = os.path.splitext(os.path.abspath(self.db_path))[0] + "_shards"
+        os.makedirs(shard_dir, exist_ok=True)
+        cids = cids if cids is not None else [None] * len(smiles)
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany("INSERT INTO rows (idx, smiles, cid) VALUES (?, ?, ?)",
+                        ((i, s, c) for i, (s, c) in enumerate(zip(smiles, cids))))
+        n = len(smiles)
+        cur.executemany("INSERT INTO batches (batch_id, start_idx, end_idx) VALUES (?, ?, ?)",
+                        ((b, start, min(start + batch_size, n))
+                         for b, start in enumerate(range(0, n, batch_size))))
+        cur.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [("shard_dir", shard_dir), ("batch_size", str(batch_size)),
+                         ("source", source or ""), ("rows", str(n))])
+        cur.execute("COMMIT")
+        return (n + batch_size - 1) // batch_size
+
+    def claim(self, worker, lease_seconds=600):
+        """
+        Claim the next pending or expired batch.
+        返回 (batch_id, [(idx, smiles, cid), ...])，没有可领取的批次时返回 None。
+        """
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = cur.execute(
+                "SELECT batch_id, start_idx, end_idx FROM batches "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY batch_id LIMIT 1", (PENDING, LEASED, now)).fetchone()
+            if row is None:
+                cur.execute("COMMIT")
+                return None
+            batch_id, start, end = row
+            cur.execute("UPDATE batches SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE batch_id = ?", (LEASED, worker, now + lease_seconds, batch_id))
+            rows = cur.execute("SELECT idx, smiles, cid FROM rows WHERE idx >= ? AND idx < ? ORDER BY idx",
+                               (start, end)).fetchall()
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return batch_id, rows
+
+    def renew(self, batch_id, worker, lease_seconds=600):
+        """Extend a lease; False if the lease was lost to another worker."""
+        cur = self.conn.execute("UPDATE batches SET lease_expires = ? WHERE batch_id = ? AND worker = ? AND status = ?",
+                                (time.time() + lease_seconds, batch_id, worker, LEASED))
+        return cur.rowcount == 1
+
+    def release(self, batch_id, worker):
+        """Give a leased batch back without finishing it."""
+        cur = self.conn.execute("UPDATE batches SET status = ?, worker = NULL, lease_expires = NULL "
+                                "WHERE batch_id = ? AND worker = ? AND status = ?",
+                                (PENDING, batch_id, worker, LEASED))
+        return cur.rowcount == 1
+
+    def complete(self, batch_id, worker, shard):
+        cur = self.conn.execute("UPDATE batches SET status = ?, shard = ?, lease_expires = NULL "
+                                "WHERE batch_id = ? AND worker = ? AND status = ?",
+                                (DONE, shard, batch_id, worker, LEASED))
+        return cur.rowcount == 1
+
+    def status(self):
+        now = time.time()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, "expired": 0}
+        for status, expired, n in self.conn.execute(
+                "SELECT status, status = ? AND lease_expires < ?, COUNT(*) FROM batches GROUP BY 1, 2",
+                (LEASED, now)):
+            counts["expired" if expired else status] += n
+        return counts
+
+    def done_shards(self):
+        return [r[0] for r in self.conn.execute(
+            "SELECT shard FROM batches WHERE status = ? ORDER BY batch_id", (DONE,))]
+
+
+def init_jobs(db_path, file_path, cid_name=None, smiles_name="SMILES", batch_size=500, shard_dir=None, verbose=False):
+    """Load the input table into a new job table; duplicate SMILES are loaded once."""
+    df = _read_table(file_path)
+    cid_col = _find_col(df.columns, cid_name, keywords=['cid', 'pubchem']) if cid_name is not None else None
+    smiles_col = _find_col(df.columns, smiles_name, keywords=['smiles', 'csmiles', 'smile', 'cleaned_smiles'])
+    if smiles_col is None:
+        raise KeyError(f"找不到 SMILES 列 '{smiles_name}'。可用列: {df.columns.tolist()}")
+    nsmi = df[smiles_col].map(_norm_smi)
+    keep = (nsmi != "") & ~nsmi.duplicated()
+    smiles = nsmi[keep].tolist()
+    cids = df.loc[keep, cid_col].astype(str).tolist() if cid_col is not None else None
+    table = JobTable(db_path)
+    try:
+        n_batches = table.load(smiles, cids, batch_size=batch_size, shard_dir=shard_dir, source=file_path)
+    finally:
+        table.close()
+    print(f"任务表已创建: {db_path}，{len(smiles)} 个唯一 SMILES（输入 {len(df)} 行），{n_batches} 个批次。")
+    return n_batches
+
+
+def _write_shard(shard_dir, batch_id, records):
+    """原子写入一个批次的结果分片（先写临时文件再 os.replace）。"""
+    final = os.path.join(shard_dir, f"batch_{batch_id:06d}.csv")
+    fd, tmp = tempfile.mkstemp(dir=shard_dir, prefix="._tmp_shard_", suffix=".csv")
+    os.close(fd)
+    pd.DataFrame(records, columns=["CID", "SMILES", "Name", "Description"]).to_csv(
+        tmp, index=False, encoding='utf-8-sig')
+    os.replace(tmp, final)
+    return final
+
+
+def run_worker(db_path, worker_id=None, lease_seconds=600, delay=0.2, max_batches=None, grace_period=30,
+               verbose=False):
+    """
+    Claim batches until none are left; returns the number of batches completed.
+    租约过半时续租；续租失败（被别的 worker 接管）则放弃当前批次。
+    收到 SIGINT/SIGTERM 时等在途请求完成后交还当前批次（release），不必等租约过期。
+    """
+    worker_id = worker_id or default_worker_id()
+    table = JobTable(db_path)
+    limiter = RateLimiter(delay)
+    cid_memo = CidMemo()
+    shutdown = GracefulShutdown(grace=grace_period)
+    done = 0
+    batch_id = None
+    try:
+        with shutdown:
+            try:
+                shard_dir = table.shard_dir
+                while max_batches is None or done < max_batches:
+                    if shutdown.stop_requested:
+                        break
+                    with shutdown.critical():
+                        claimed = table.claim(worker_id, lease_seconds)
+                        if claimed is None:
+                            break
+                        batch_id, rows = claimed
+                    if verbose:
+                        print(f"[{worker_id}] claimed batch {batch_id} ({len(rows)} rows)")
+                    records = []
+                    renewed_at = time.monotonic()
+                    lost = stopped = False
+                    for _, smiles, _ in rows:
+                        if shutdown.stop_requested:
+                            stopped = True
+                            break
+                        cid, name, description = pubchem.fetch_annotation_by_smiles(smiles, verbose=verbose,
+                                                                                    cid_memo=cid_memo, limiter=limiter)
+                        if name or description:
+                            records.append({"CID": cid, "SMILES": smiles, "Name": name, "Description": description})
+                        if time.monotonic() - renewed_at > lease_seconds / 2:
+                            if not table.renew(batch_id, worker_id, lease_seconds):
+                                lost = True
+                                break
+                            renewed_at = time.monotonic()
+                    if lost:
+                        print(f"[{worker_id}] lease on batch {batch_id} lost, skipping.", file=sys.stderr)
+                        batch_id = None
+                        continue
+                    if stopped:
+                        break
+                    with shutdown.critical():
+                        shard = _write_shard(shard_dir, batch_id, records)
+                        completed = table.complete(batch_id, worker_id, shard)
+                        finished, batch_id = batch_id, None
+                    if completed:
+                        done += 1
+                        if verbose:
+                            print(f"[{worker_id}] batch {finished} done -> {shard}")
+                    else:
+                        print(f"[{worker_id}] lease on batch {finished} expired before completion.", file=sys.stderr)
+            finally:
+                # 中断时交还未完成的批次，别的 worker 可立即领取
+                if batch_id is not None:
+                    with shutdown.critical():
+                        if table.release(batch_id, worker_id):
+                            print(f"[{worker_id}] released batch {batch_id}.", file=sys.stderr)
+    except KeyboardInterrupt:
+        print(f"[{worker_id}] 宽限期内未完成在途请求，已放弃当前请求。", file=sys.stderr)
+    finally:
+        table.close()
+    print(f"[{worker_id}] {cid_memo.summary()}.")
+    return done
+
+
+def merge_shards(db_path, out_path, verbose=False):
+    """Concatenate shards of finished batches (in batch order) into out_path."""
+    table = JobTable(db_path)
+    try:
+        shards = table.done_shards()
+        counts = table.status()
+    finally:
+        table.close()
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    n_rows = 0
+    tmp = out_path + ".merging"
+    with open(tmp, 'w', encoding='utf-8-sig', newline='') as out:
+        out.write("CID,SMILES,Name,Description\n")
+        for shard in shards:
+            with open(shard, 'r', encoding='utf-8-sig', newline='') as f:
+                f.readline()  # 跳过表头
+                for line in f:
+                    out.write(line)
+                    n_rows += 1
+    os.replace(tmp, out_path)
+    unfinished = counts[PENDING] + counts[LEASED] + counts["expired"]
+    if unfinished:
+        print(f"警告：还有 {unfinished} 个批次未完成，输出不完整。", file=sys.stderr)
+    print(f"已合并 {len(shards)} 个分片到 {out_path}。")
+    return out_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lease-based distributed annotation jobs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("init", help="把输入表载入任务表")
+    p.add_argument("--db", required=True, help="任务表 SQLite 路径（共享文件系统）")
+    p.add_argument("--file_path", "-f", required=True, help="输入表路径")
+    p.add_argument("--cid", default=None, help="CID 列名")
+    p.add_argument("--smiles", default="SMILES", help="SMILES 列名")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--shard-dir", default=None, help="分片目录（默认与任务表同目录）")
+
+    p = sub.add_parser("work", help="领取并处理批次")
+    p.add_argument("--db", required=True)
+    p.add_argument("--worker-id", default=None)
+    p.add_argument("--lease", type=float, default=600, help="租约时长（秒）")
+    p.add_argument("--delay", type=float, default=0.2)
+    p.add_argument("--max-batches", type=int, default=None)
+    p.add_argument("--grace", type=float, default=30, help="收到 SIGINT/SIGTERM 后等待在途请求完成的最长秒数")
+    p.add_argument("--verbose", action="store_true")
+
+    p = sub.add_parser("status", help="查看批次状态")
+    p.add_argument("--db", required=True)
+
+    p = sub.add_parser("merge", help="合并已完成批次的分片")
+    p.add_argument("--db", required=True)
+    p.add_argument("--out", required=True, help="输出文件路径")
+
+    args = parser.parse_args(argv)
+    if args.command == "init":
+        init_jobs(args.db, args.file_path, cid_name=args.cid, smiles_name=args.smiles,
+                  batch_size=args.batch_size, shard_dir=args.shard_dir)
+    elif args.command == "work":
+        n = run_worker(args.db, worker_id=args.worker_id, lease_seconds=args.lease, delay=args.delay,
+                       max_batches=args.max_batches, grace_period=args.grace, verbose=args.verbose)
+        print(f"完成 {n} 个批次。")
+    elif args.command == "status":
+        table = JobTable(args.db)
+        try:
+            print(table.status())
+        finally:
+            table.close()
+    elif args.command == "merge":
+        merge_shards(args.db, args.out)
+
+
+if __name__ == "__main__":
+    main()
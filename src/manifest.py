@@ -0,0 +1,93 @@
+"""
+Run manifest for incremental (delta) runs between input-file versions.
+
+The manifest records, for every normalized SMILES of an input version, a
+fingerprint of the row identity (normalized SMILES + input CID) and the
+outcome of the lookup ("hit" = written to the output, "miss" = PubChem had
+nothing).  A later version of the same input is diffed against it so that
+only new or changed identifiers are fetched again.
+"""
+import hashlib
+import os
+import time
+
+from .storage import save_state, load_state
+
+HIT = "hit"
+MISS = "miss"
+
+
+def row_fingerprint(nsmi, cid=None):
+    """Fingerprint of one input row: normalized SMILES + input CID."""
+    cid_str = "" if cid is None else str(cid).strip()
+    if cid_str.lower() in {"nan", "none"}:
+        cid_str = ""
+    # pandas 读入的整数列可能带 .0
+    if cid_str.endswith(".0") and cid_str[:-2].isdigit():
+        cid_str = cid_str[:-2]
+    return hashlib.sha1(f"{nsmi}\t{cid_str}".encode("utf-8")).hexdigest()[:16]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha1 of an input file, used to identify an input version."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """Per-row fingerprints and outcomes of the last input version."""
+
+    def __init__(self, path):
+        self.path = path
+        state = load_state(path) if path and os.path.exists(path) else None
+        state = state or {}
+        # entries: nsmi -> [fingerprint, outcome]
+        self.entries = state.get("entries", {})
+        self.versions = state.get("versions", [])
+        self.output = state.get("output")
+
+    def outcome(self, nsmi, fp):
+        """Recorded outcome for an unchanged row, otherwise None."""
+        entry = self.entries.get(nsmi)
+        if entry is None or entry[0] != fp:
+            return None
+        return entry[1]
+
+    def diff(self, rows):
+        """
+        Split (nsmi, fp) rows into unchanged hits, unchanged misses and the
+        set of new/changed identifiers that have to be fetched.
+        """
+        hits, misses, todo = set(), set(), set()
+        for nsmi, fp in rows:
+            outcome = self.outcome(nsmi, fp)
+            if outcome == HIT:
+                hits.add(nsmi)
+            elif outcome == MISS:
+                misses.add(nsmi)
+            else:
+                todo.add(nsmi)
+        return hits, misses, todo
+
+    def update(self, entries, input_path, out_path):
+        """Replace the entries with those of a new input version."""
+        self.entries = entries
+        self.output = out_path
+        self.versions.append({
+            "input": input_path,
+            "sha1": file_digest(input_path) if os.path.exists(input_path) else None,
+            "output": out_path,
+            "rows": len(entries),
+            "hits": sum(1 for e in entries.values() if e[1] == HIT),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    def save(self):
+        out_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(out_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        save_state({"output": self.output, "versions": self.versions, "entries": self.entries}, tmp_path)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,277 @@
+"""
+Dry-run capacity planner: estimate requests, bytes and wall time before a run.
+
+    python -m src.plan --file_path data/inputs/Herb-Ingredient_with_validation.csv --smiles SMILES \
+        --out output/smiles_annotation关联结果.csv --manifest checkpoints/manifest.json \
+        --description-store data/record_descriptions.sqlite --probe 20 --delay 0.2 --mode stream --workers 4
+
+The input is read (only the identifier columns) and reduced to unique
+normalized SMILES; rows already covered by the existing output, by the run
+manifest (unchanged rows of the last input version) and, when the input has a
+CID column, by the description store are subtracted.  A small random sample of
+the remaining rows is then sent through the same endpoints a run uses
+(SMILES→CID, synonyms, pug_view), timing each request and recording the
+payload size.  From the sample the planner projects:
+
+  requests   SMILES→CID 每行一次；synonyms / pug_view 每个不同且 store 未收录的 CID 一次
+  bytes      请求数 × 探测得到的平均响应大小
+  wall time  按 --mode 估算：
+               serial  process_annotations / run_batch_main.py：逐行请求，每行之后 sleep(delay)
+               stream  annotate_many：workers 个线程共享一个 RateLimiter，每个 HTTP 请求间隔 delay
+               jobs    workers 个 jobs worker，各自逐行请求，各有自己的 RateLimiter
+
+Nothing is written; the probe requests are the only network traffic.
+"""
+import argparse
+import os
+import random
+import time
+
+import requests
+
+from .manifest import RunManifest, row_fingerprint
+from .pubchem import (PUG_VIEW_URL, SMILES_TO_CID_URL, SYNONYMS_URL, RateLimiter, _clean_smiles, _find_col,
+                      _load_processed, _norm_smi, _read_table)
+
+ENDPOINTS = ("smiles_to_cid", "synonyms", "pug_view")
+MODES = ("serial", "stream", "jobs")
+# PubChem PUG-REST 使用政策：每秒不超过 5 个请求
+PUBCHEM_MAX_RPS = 5.0
+
+
+def _timed(method, url, **kwargs):
+    """(response_or_None, seconds, bytes) for one request."""
+    start = time.perf_counter()
+    try:
+        r = method(url, **kwargs)
+        return r, time.perf_counter() - start, len(r.content or b"")
+    except Exception:
+        return None, time.perf_counter() - start, 0
+
+
+def probe_endpoints(smiles, store=None, delay=0.2, verbose=False):
+    """
+    Send each SMILES through the endpoints a run would hit and measure them.
+    Returns (stats, cids): stats maps endpoint -> {"requests", "errors", "seconds", "bytes"} totals,
+    cids is the list of resolved CIDs (None where resolution failed).
+    """
+    headers = {"User-Agent": "python-requests/1.0 (contact: none)", "Cache-Control": "no-cache"}
+    stats = {ep: {"requests": 0, "errors": 0, "seconds": 0.0, "bytes": 0} for ep in ENDPOINTS}
+    limiter = RateLimiter(delay)
+    fetched = set()
+    cids = []
+
+    def record(ep, result):
+        r, seconds, nbytes = result
+        s = stats[ep]
+        s["requests"] += 1
+        s["seconds"] += seconds
+        s["bytes"] += nbytes
+        if r is None or r.status_code != 200:
+            s["errors"] += 1
+        return r
+
+    for smi in smiles:
+        smiles_str = _clean_smiles(str(smi).strip())
+        limiter.wait()
+        r = record("smiles_to_cid", _timed(requests.post, SMILES_TO_CID_URL.format(smiles=smiles_str),
+                                           data=smiles_str, headers=headers, timeout=10))
+        text = r.text.strip() if r is not None and r.status_code == 200 else ""
+        cid = int(text) if text.isdigit() and int(text) > 0 else None
+        cids.append(cid)
+        if verbose:
+            print(f"probe {smiles_str[:60]} -> CID {cid}")
+        # 与运行时一致：store 已收录或本次已请求过的 CID 不再请求
+        if cid is None or cid in fetched or (store is not None and store.get(cid) is not None):
+            continue
+        fetched.add(cid)
+        limiter.wait()
+        record("synonyms", _timed(requests.get, SYNONYMS_URL.format(cid=cid), timeout=10, headers=headers))
+        limiter.wait()
+        record("pug_view", _timed(requests.get, PUG_VIEW_URL.format(cid=cid), timeout=12, headers=headers))
+    return stats, cids
+
+
+def plan_run(file_path,
+             smiles_name="smiles",
+             cid_name=None,
+             out_path=None,
+             manifest_path=None,
+             description_store=None,
+             probe=20,
+             delay=0.2,
+             mode="serial",
+             workers=1,
+             seed=0,
+             verbose=False):
+    """
+    Estimate the cost of annotating ``file_path``; returns a dict with the row
+    counts, probe measurements and projection (see module docstring).
+    Parameters mirror process_annotations; probe 为探测样本行数（0 不发请求，只统计行数）。
+    cid_name 要与实际运行一致：运行清单的指纹包含输入 CID。
+    mode / workers: 运行方式（见模块说明）及并发数
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    columns = _read_table(file_path, nrows=100).columns
+    smiles_col = _find_col(columns, smiles_name, keywords=['smiles', 'csmiles', 'smile', 'cleaned_smiles'])
+    cid_col = _find_col(columns, cid_name, keywords=['cid', 'pubchem']) if cid_name is not None else None
+    if smiles_col is None:
+        raise KeyError(f"找不到 SMILES 列 '{smiles_name}'。可用列: {columns.tolist()}")
+    df = _read_table(file_path, columns={c for c in (cid_col, smiles_col) if c is not None})
+
+    # 归一化后去重；保留每个 SMILES 第一次出现时的原始写法和 CID
+    rows = {}
+    cid_values = df[cid_col].to_numpy() if cid_col is not None else None
+    for i, smi in enumerate(df[smiles_col].to_numpy()):
+        nsmi = _norm_smi(smi)
+        if nsmi and nsmi not in rows:
+            rows[nsmi] = (smi, cid_values[i] if cid_values is not None else None)
+    counts = {"rows": len(df), "unique": len(rows)}
+    del df
+
+    if out_path is None:
+        out_path = os.path.splitext(file_path)[0] + "_smiles_annotation关联结果.csv"
+    processed, _ = _load_processed(out_path, compact=True, verbose=verbose)
+    remaining = [nsmi for nsmi in rows if nsmi not in processed]
+    counts["in_output"] = len(rows) - len(remaining)
+
+    counts["in_manifest"] = counts["manifest_changed"] = 0
+    if manifest_path:
+        manifest = RunManifest(manifest_path)
+        hits, misses, _ = manifest.diff((nsmi, row_fingerprint(nsmi, rows[nsmi][1])) for nsmi in remaining)
+        covered = hits | misses
+        # 清单里有记录但指纹不同：行确实变了，或 --cid 与实际运行不一致
+        counts["manifest_changed"] = sum(1 for nsmi in remaining if nsmi in manifest.entries and nsmi not in covered)
+        remaining = [nsmi for nsmi in remaining if nsmi not in covered]
+        counts["in_manifest"] = len(covered)
+
+    store = None
+    if description_store is not None:
+        from .harvest import DescriptionStore
+        store = DescriptionStore(description_store) if isinstance(description_store, str) else description_store
+    try:
+        # 有 CID 列时可直接统计 store 覆盖；否则由探测样本估计
+        counts["in_store"] = None
+        if store is not None and cid_col is not None:
+            in_store = sum(1 for nsmi in remaining if store.get(rows[nsmi][1]) is not None)
+            counts["in_store"] = in_store
+        counts["remaining"] = len(remaining)
+
+        sample = random.Random(seed).sample(remaining, min(probe, len(remaining))) if probe > 0 else []
+        stats, cids = probe_endpoints([rows[nsmi][0] for nsmi in sample], store=store, delay=delay,
+                                      verbose=verbose)
+    finally:
+        if store is not None and isinstance(description_store, str):
+            store.close()
+
+    n = len(remaining)
+    probed = len(sample)
+    means = {ep: {"latency": s["seconds"] / s["requests"] if s["requests"] else 0.0,
+                  "bytes": s["bytes"] / s["requests"] if s["requests"] else 0.0,
+                  "error_rate": s["errors"] / s["requests"] if s["requests"] else 0.0}
+             for ep, s in stats.items()}
+    # 每行需要请求 CID 页面的比例：已解析、store 未收录、且与样本内其他行不重复的 CID
+    cid_ratio = stats["pug_view"]["requests"] / probed if probed else 0.0
+    expected = {"smiles_to_cid": n, "synonyms": round(n * cid_ratio), "pug_view": round(n * cid_ratio)}
+    nbytes = {ep: expected[ep] * means[ep]["bytes"] for ep in ENDPOINTS}
+    per_row = sum(means[ep]["latency"] * expected[ep] for ep in ENDPOINTS) / n if n else 0.0
+    total_requests = sum(expected.values())
+    workers = max(int(workers), 1)
+
+    if mode == "serial":
+        # process_annotations：逐行请求，每行之后 sleep(delay)
+        wall = n * (per_row + delay)
+    elif mode == "stream":
+        # annotate_many：共享的 limiter 限制所有请求，workers 个线程并行
+        wall = max(total_requests * delay, n * per_row / workers)
+    else:
+        # jobs：每个 worker 逐行请求，只受自己的 limiter 限制
+        reqs_per_row = total_requests / n if n else 0.0
+        wall = n / workers * max(per_row, reqs_per_row * delay)
+    rps = total_requests / wall if wall > 0 else 0.0
+
+    return {
+        "input": file_path,
+        "output": out_path,
+        "counts": counts,
+        "probe": {"rows": probed, "resolved": sum(c is not None for c in cids), "endpoints": means},
+        "expected_requests": expected,
+        "expected_bytes": nbytes,
+        "per_row_seconds": per_row,
+        "wall_seconds": wall,
+        "requests_per_second": rps,
+        "delay": delay,
+        "mode": mode,
+        "workers": workers,
+    }
+
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _fmt_duration(seconds):
+    h, rem = divmod(int(round(seconds)), 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+def print_plan(plan):
+    c = plan["counts"]
+    print(f"Input: {plan['input']}")
+    print(f"  rows {c['rows']}, unique normalized SMILES {c['unique']}")
+    print(f"  already in output   {c['in_output']:>10}   ({plan['output']})")
+    print(f"  unchanged (manifest){c['in_manifest']:>10}")
+    if c["manifest_changed"]:
+        print(f"  Note: {c['manifest_changed']} rows are in the manifest with a different fingerprint. "
+              "The fingerprint includes the input CID; pass the same --cid as the run.")
+    if c["in_store"] is not None:
+        print(f"  CID in store        {c['in_store']:>10}   (SMILES→CID still requested)")
+    print(f"  to fetch            {c['remaining']:>10}")
+
+    p = plan["probe"]
+    print(f"\nProbe: {p['rows']} rows, {p['resolved']} resolved to a CID")
+    print(f"{'endpoint':<16}{'latency':>10}{'size':>12}{'errors':>9}{'requests':>12}{'download':>12}")
+    for ep in ENDPOINTS:
+        m = p["endpoints"][ep]
+        print(f"{ep:<16}{m['latency'] * 1000:>8.0f}ms{_fmt_bytes(m['bytes']):>12}{m['error_rate']:>8.0%}"
+              f"{plan['expected_requests'][ep]:>12}{_fmt_bytes(plan['expected_bytes'][ep]):>12}")
+    print(f"{'total':<16}{'':>31}{sum(plan['expected_requests'].values()):>12}"
+          f"{_fmt_bytes(sum(plan['expected_bytes'].values())):>12}")
+
+    print(f"\nProjected wall time ({plan['mode']}, delay={plan['delay']}s, workers={plan['workers']}): "
+          f"{_fmt_duration(plan['wall_seconds'])} ({plan['per_row_seconds'] * 1000:.0f} ms/row of requests, "
+          f"{plan['requests_per_second']:.1f} req/s)")
+    if plan["requests_per_second"] > PUBCHEM_MAX_RPS:
+        print(f"Warning: {plan['requests_per_second']:.1f} req/s exceeds PubChem's limit of "
+              f"{PUBCHEM_MAX_RPS:.0f} req/s; increase --delay or reduce --workers.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate requests, download size and wall time before a run.")
+    parser.add_argument("--file_path", required=True, help="输入表格路径")
+    parser.add_argument("--smiles", default="smiles", help="SMILES 列名（模糊匹配）")
+    parser.add_argument("--cid", default=None, help="CID 列名；给出时直接按 CID 统计 description store 覆盖")
+    parser.add_argument("--out", default=None, help="已有输出 CSV（默认与 process_annotations 相同）")
+    parser.add_argument("--manifest", default=None, help="运行清单路径")
+    parser.add_argument("--description-store", default=None, help="本地 CID→description store 路径")
+    parser.add_argument("--probe", type=int, default=20, help="探测样本行数（0 不发请求）")
+    parser.add_argument("--delay", type=float, default=0.2, help="计划使用的请求间隔（秒）")
+    parser.add_argument("--mode", choices=MODES, default="serial",
+                        help="serial = run_batch_main.py，stream = annotate_many，jobs = python -m src.jobs work")
+    parser.add_argument("--workers", type=int, default=1, help="stream 的线程数 / jobs 的 worker 数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    print_plan(plan_run(args.file_path, smiles_name=args.smiles, cid_name=args.cid, out_path=args.out,
+                        manifest_path=args.manifest, description_store=args.description_store, probe=args.probe,
+                        delay=args.delay, mode=args.mode, workers=args.workers, seed=args.seed,
+                        verbose=args.verbose))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import os
+from contextlib import nullcontext
+
+from .pubchem import fetch_annotation_by_smiles
+from .shutdown import GracefulShutdown
+from .storage import save_state, load_state
 
 class BatchProcessor:
-    def __init__(self, file, cid_name, smiles_name, out_path=None, delay=0.2, save_every=20, max_rows=None, sample=False):
+    def __init__(self, file, cid_name, smiles_name, out_path=None, delay=0.2, save_every=20, max_rows=None, sample=False,
+                 resume=False, verbose=False, checkpoint_path=None, grace_period=30):
         self.file = file
         self.cid_name = cid_name
         self.smiles_name = smiles_name
@@ -10,6 +16,10 @@ class BatchProcessor:
         self.save_every = save_every
         self.max_rows = max_rows
         self.sample = sample
+        self.resume_from_checkpoint = resume
+        self.verbose = verbose
+        self.checkpoint_path = checkpoint_path
+        self.grace_period = grace_period
         self.running = False
         self.processed = {}
         self.results = []
@@ -26,12 +36,37 @@ class BatchProcessor:
         self.running = True
         self.process_annotations()
 
-    def process_annotations(self):
+    def run(self):
+        """
+        Run with SIGINT/SIGTERM handling: stop dispatching new rows, let the
+        in-flight request finish, flush results and write a final checkpoint.
+        """
+        if self.resume_from_checkpoint and self.checkpoint_path:
+            state = load_state(self.checkpoint_path) or {}
+            self.current_index = state.get("current_state", {}).get("current_index", 0)
+        self.running = True
+        shutdown = GracefulShutdown(grace=self.grace_period)
+        with shutdown:
+            try:
+                self.process_annotations(shutdown=shutdown)
+            except KeyboardInterrupt:
+                print("宽限期内未完成在途请求，已放弃当前请求。")
+            finally:
+                self.running = False
+                # 仍在信号处理之内写盘：再次中断推迟到写完之后
+                try:
+                    with shutdown.critical():
+                        self.save_results()
+                        self.save_state()
+                except KeyboardInterrupt:
+                    pass
+
+    def process_annotations(self, shutdown=None):
         import pandas as pd
         from tqdm import tqdm
-        import os
         import time
 
+        critical = shutdown.critical if shutdown is not None else nullcontext
         df = pd.read_csv(self.file)
         cid_list = df[self.cid_name].astype(str).tolist()
         smiles_list = df[self.smiles_name].astype(str).tolist()
@@ -41,6 +76,7 @@ class BatchProcessor:
 
         if self.max_rows is not None:
             indices = indices[:self.max_rows]
+        self.total = len(indices)
 
         if self.out_path is None:
             self.out_path = os.path.join(os.path.dirname(self.file), "smiles_annotation_results.csv")
@@ -51,34 +87,57 @@ class BatchProcessor:
                 self.processed[str(r.get('smiles'))] = True
 
         for i in tqdm(indices[self.current_index:], total=len(indices) - self.current_index):
-            if not self.running:
+            if not self.running or (shutdown is not None and shutdown.stop_requested):
                 break
 
             smiles = smiles_list[i]
-            cid, name, desc = self.get_annotation_by_smiles(smiles)  # Placeholder for actual annotation retrieval logic
+            cid, name, desc = self.get_annotation_by_smiles(smiles)
 
             if name or desc:
                 self.results.append({"CID": cid, "SMILES": smiles, "name": name, "description": desc})
                 self.processed[str(smiles)] = True
+            self.current_index += 1
 
             if len(self.results) >= self.save_every:
-                self.save_results()
+                with critical():
+                    self.save_results()
 
             time.sleep(self.delay)
 
-        self.save_results(final=True)
+        with critical():
+            self.save_results(final=True)
+        return self.out_path
 
     def save_results(self, final=False):
         import pandas as pd
 
-        _df = pd.DataFrame(self.results)
-        mode = 'a' if os.path.exists(self.out_path) else 'w'
-        header = not os.path.exists(self.out_path)
-        _df.to_csv(self.out_path, index=False, mode=mode, header=header)
+        if self.results:
+            _df = pd.DataFrame(self.results)
+            mode = 'a' if os.path.exists(self.out_path) else 'w'
+            header = not os.path.exists(self.out_path)
+            _df.to_csv(self.out_path, index=False, mode=mode, header=header)
+            self.results = []
 
         if final:
-            print(f"Final results saved to {self.out_path}.") 
+            print(f"Final results saved to {self.out_path}.")
+
+    def save_state(self):
+        """Write the current position to the checkpoint file and return the state."""
+        state = {"current_state": {
+            "processed_cids": [],
+            "total_cids": getattr(self, "total", 0),
+            "last_processed_index": self.current_index - 1,
+            "current_index": self.current_index,
+            "is_running": self.running,
+            "out_path": self.out_path,
+        }}
+        if self.checkpoint_path:
+            save_state(state, self.checkpoint_path)
+        return state
+
+    def get_annotation_by_smiles(self, smiles):
+        return fetch_annotation_by_smiles(smiles, verbose=self.verbose)
 
     def get_annotation(self, cid):
         # Placeholder for the actual implementation of fetching annotation by CID
-        return None, None  # Replace with actual logic to fetch name and description
\ No newline at end of file
+        return None, None  # Replace with actual logic to fetch name and description
@@ -2,14 +2,75 @@ import time, random, requests
 import pandas as pd
 import os, sys
 import re
+import threading
 import time as _time
 import random as _random
 from tqdm import tqdm
 
-def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
+from .hashset import HashedSet
+from .manifest import RunManifest, row_fingerprint, HIT, MISS
+from .shutdown import GracefulShutdown
+from .storage import save_state
+
+SMILES_TO_CID_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/smiles/{smiles}/cids/TXT"
+SYNONYMS_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/synonyms/JSON"
+PUG_VIEW_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/{cid}/JSON"
+
+# 递归查找包含目标 heading 的 sections
+def find_sections(sections, target="Record Description"):
+    res = []
+    for s in sections or []:
+        # 多种字段名兼容
+        heading = None
+        toc = s.get("TOCHeading")
+        if isinstance(toc, dict):
+            heading = toc.get("#TOCHeading") or toc.get("TOCHeading")
+        if not heading:
+            heading = s.get("TOCHeading") or s.get("Heading")
+        if heading and target.lower() in str(heading).lower():
+            res.append(s)
+        # 递归子 section（可能字段名不同）
+        subs = s.get("Section") or s.get("Sections") or s.get("SectionList") or []
+        if subs:
+            res.extend(find_sections(subs, target=target))
+    return res
+
+# 文本提取器（递归，支持 StringWithMarkup / String / 嵌套结构）
+def extract_texts_from_data(data_block):
+    texts = []
+    def _ext(o):
+        if isinstance(o, dict):
+            if "StringWithMarkup" in o:
+                for itm in o["StringWithMarkup"] if isinstance(o["StringWithMarkup"], list) else []:
+                    if isinstance(itm, dict) and "String" in itm and isinstance(itm["String"], str):
+                        texts.append(itm["String"])
+            elif "String" in o and isinstance(o["String"], str):
+                texts.append(o["String"])
+            else:
+                for v in o.values():
+                    _ext(v)
+        elif isinstance(o, list):
+            for it in o:
+                _ext(it)
+    _ext(data_block)
+    return [t for t in texts if t and isinstance(t, str)]
+
+class FetchFailed(Exception):
+    """synonyms 或 compound 页面请求失败；name / description 为已取得的部分结果。"""
+
+    def __init__(self, cid, name=None, description=None, what="compound page"):
+        super().__init__(f"CID {cid}: {what} request failed")
+        self.cid = cid
+        self.name = name
+        self.description = description
+
+def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False, limiter=None, raise_on_failure=False):
     """
     Fetch annotation from PubChem API using the provided CID.
     Implements retry logic in case of failures.
+    limiter: 可选的 RateLimiter，每个 HTTP 请求（含重试）前等待
+    raise_on_failure: True 时 synonyms 请求失败或 compound 页面重试用尽（非 200/404、超时）抛出
+                      FetchFailed，以便与"记录没有 name / description"区分（CidMemo 不缓存失败结果）
     Returns the name and description of the compound.
     """
 
@@ -23,13 +84,17 @@ def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
 
     # 1) synonyms 作为候选 name
     name = None
-    syn_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid_str}/synonyms/JSON"
+    syn_failed = False
+    syn_url = SYNONYMS_URL.format(cid=cid_str)
     try:
         if verbose:
             print("Prepared synonyms URL:", syn_url)
+        if limiter is not None:
+            limiter.wait()
         r = requests.get(syn_url, timeout=10, headers=headers)
         if verbose:
             print("Synonyms ->", r.url, r.status_code)
+        syn_failed = r.status_code not in (200, 404)
         if r.status_code == 200:
             j = r.json()
             info = j.get("InformationList", {}).get("Information", [])
@@ -38,17 +103,29 @@ def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
                 if syns:
                     name = syns[0]
     except Exception as e:
+        syn_failed = True
         if verbose:
             print("synonyms 请求异常:", e)
 
+    def _result(n, d):
+        # synonyms 失败时 name 退回为 section 标题，不是真实结果
+        if raise_on_failure and syn_failed:
+            raise FetchFailed(cid_str, n, d, what="synonyms")
+        return n, d
+
     # 2) compound-specific 页面（优先）
-    compound_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/{cid_str}/JSON"
+    compound_url = PUG_VIEW_URL.format(cid=cid_str)
     if verbose:
         print("Compound data URL:", compound_url)
 
+    last_status = None
     for attempt in range(1, retries + 1):
+        last_status = None
         try:
+            if limiter is not None:
+                limiter.wait()
             r = requests.get(compound_url, timeout=12, headers=headers)
+            last_status = r.status_code
             if verbose:
                 print(f"GET {r.url} -> {r.status_code}")
             if r.status_code != 200:
@@ -60,50 +137,11 @@ def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
             data = r.json()
             record = data.get("Record", {}) or {}
 
-            # 递归查找包含目标 heading 的 sections
-            def find_sections(sections, target="Record Description"):
-                res = []
-                for s in sections or []:
-                    # 多种字段名兼容
-                    heading = None
-                    toc = s.get("TOCHeading")
-                    if isinstance(toc, dict):
-                        heading = toc.get("#TOCHeading") or toc.get("TOCHeading")
-                    if not heading:
-                        heading = s.get("TOCHeading") or s.get("Heading")
-                    if heading and target.lower() in str(heading).lower():
-                        res.append(s)
-                    # 递归子 section（可能字段名不同）
-                    subs = s.get("Section") or s.get("Sections") or s.get("SectionList") or []
-                    if subs:
-                        res.extend(find_sections(subs, target=target))
-                return res
-
             sections = record.get("Section") or record.get("Sections") or []
             rd_secs = find_sections(sections, target="Record Description")
             if verbose:
                 print("Record Description sections found:", len(rd_secs))
 
-            # 文本提取器（递归，支持 StringWithMarkup / String / 嵌套结构）
-            def extract_texts_from_data(data_block):
-                texts = []
-                def _ext(o):
-                    if isinstance(o, dict):
-                        if "StringWithMarkup" in o:
-                            for itm in o["StringWithMarkup"] if isinstance(o["StringWithMarkup"], list) else []:
-                                if isinstance(itm, dict) and "String" in itm and isinstance(itm["String"], str):
-                                    texts.append(itm["String"])
-                        elif "String" in o and isinstance(o["String"], str):
-                            texts.append(o["String"])
-                        else:
-                            for v in o.values():
-                                _ext(v)
-                    elif isinstance(o, list):
-                        for it in o:
-                            _ext(it)
-                _ext(data_block)
-                return [t for t in texts if t and isinstance(t, str)]
-
             # 在 Record Description sections 中提取第一个合理的 description
             for sec in rd_secs:
                 # 常见位置：Information / InformationList / Data
@@ -118,7 +156,7 @@ def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
                         desc = "\n".join(texts[:6])
                         if verbose:
                             print("Found Record Description (truncated):", desc[:200])
-                        return (name or sec.get("TOCHeading") or sec.get("Heading")), desc
+                        return _result(name or sec.get("TOCHeading") or sec.get("Heading"), desc)
 
                 # 有时 section 自身也直接包含 Data 字段
                 data_items = sec.get("Data") or sec.get("Information") or []
@@ -127,25 +165,39 @@ def fetch_annotation_by_cid(cid, retries=3, backoff=1.5, verbose=False):
                     desc = "\n".join(texts[:6])
                     if verbose:
                         print("Found description in section fallback (truncated):", desc[:200])
-                    return (name or sec.get("TOCHeading") or sec.get("Heading")), desc
+                    return _result(name or sec.get("TOCHeading") or sec.get("Heading"), desc)
 
             # 未找到 Record Description -> 返回 name（若有）并退出
             if verbose:
                 print("No Record Description found in compound page for CID", cid_str)
-            return name, None
+            return _result(name, None)
 
+        except FetchFailed:
+            raise
         except Exception as e:
             if attempt == retries and verbose:
                 print(f"请求错误 {cid_str}: {e}")
             time.sleep(min(backoff ** attempt + random.random(), 5))
 
-    return name, None
+    # 404 表示 PubChem 没有该记录，属于正常结果；其余为请求失败
+    if raise_on_failure and last_status != 404:
+        raise FetchFailed(cid_str, name)
+    return _result(name, None)
+
+def _clean_smiles(smiles_str):
+    """去除 SMILES 中的非法字符（如引号、换行符）"""
+    return re.sub(r'["\n\r\t]', '', smiles_str)
 
-def fetch_annotation_by_smiles(smiles, retries=3, backoff=1.5, verbose=False):
+def fetch_annotation_by_smiles(smiles, retries=3, backoff=1.5, verbose=False, description_store=None, cid_memo=None,
+                               limiter=None):
     """
     从 PubChem compound page 获取注释（优先 Record Description）。
     输入：SMILES 字符串
-    返回：(name_or_None, description_or_None)
+    description_store: 可选的本地 CID→description store（见 harvest.py），命中时不再请求 CID 页面
+    cid_memo: 可选的 CidMemo，按 CID 合并并发请求并缓存结果
+    limiter: 可选的 RateLimiter，每个 HTTP 请求（含重试）前等待
+    返回：(cid_or_None, name_or_None, description_or_None)；
+          cid 为 0 表示 PubChem 明确没有该 SMILES 的 CID，None 表示请求失败（下次应重试）
     """
 
     # ==================== 新增：SMILES 预处理与校验 ====================
@@ -158,7 +210,7 @@ def fetch_annotation_by_smiles(smiles, retries=3, backoff=1.5, verbose=False):
             print("无效 SMILES：空值或非法字符串")
         return None, None, None
     # 简单清洗：去除 SMILES 中的非法字符（如引号、换行符）
-    smiles_str = re.sub(r'["\n\r\t]', '', smiles_str)
+    smiles_str = _clean_smiles(smiles_str)
     if verbose:
         print(f"处理 SMILES：{smiles_str}")
 
@@ -166,11 +218,13 @@ def fetch_annotation_by_smiles(smiles, retries=3, backoff=1.5, verbose=False):
 
     # ==================== 新增：SMILES → CID 转换 ====================
     cid = None
-    smiles_to_cid_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/smiles/{smiles_str}/cids/TXT"
+    smiles_to_cid_url = SMILES_TO_CID_URL.format(smiles=smiles_str)
     try:
         if verbose:
             print("SMILES 转 CID 请求 URL:", smiles_to_cid_url)
         # PubChem SMILES 转 CID 接口需用 POST 方法，数据为 SMILES 字符串
+        if limiter is not None:
+            limiter.wait()
         r = requests.post(
             smiles_to_cid_url,
             data=smiles_str,
@@ -186,139 +240,390 @@ def fetch_annotation_by_smiles(smiles, retries=3, backoff=1.5, verbose=False):
                 if verbose:
                     print(f"成功获取 CID：{cid}")
             else:
+                cid = 0
                 if verbose:
                     print(f"SMILES 转 CID 失败：返回非数字结果 '{cid_str}'")
         else:
+            # 400 / 404 是 PubChem 的明确答复（无法解析 / 没有该结构），其余（5xx、429 等）按请求失败处理
+            if r.status_code in (400, 404):
+                cid = 0
             if verbose:
                 print(f"SMILES 转 CID 失败：状态码 {r.status_code}，响应内容：{r.text[:100]}")
     except Exception as e:
         if verbose:
             print(f"SMILES 转 CID 请求异常: {e}")
-    # 若 CID 获取失败，直接返回空结果
+    # 请求失败返回 None；PubChem 明确没有 CID 时返回 0，调用方据此区分（如运行清单记为 MISS）
     if cid is None:
         return None, None, None
+    if cid == 0:
+        return 0, None, None
 
+    # 本地 store 已收录该 CID 时直接返回
+    if description_store is not None and cid:
+        stored = description_store.get(cid)
+        if stored is not None:
+            if verbose:
+                print(f"CID {cid} 命中本地 description store")
+            return cid, stored[0], stored[1]
 
     # ==================== 复用原逻辑：CID → 名称 + 注释 ====================
-    # 1) 从 CID 获取同义词（作为候选 name）
-    name = None
-    syn_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/synonyms/JSON"
-    try:
-        if verbose:
-            print("Prepared synonyms URL:", syn_url)
-        r = requests.get(syn_url, timeout=10, headers=headers)
-        if verbose:
-            print("Synonyms ->", r.url, r.status_code)
-        if r.status_code == 200:
-            j = r.json()
-            info = j.get("InformationList", {}).get("Information", [])
-            if info:
-                syns = info[0].get("Synonym", [])
-                if syns:
-                    name = syns[0]
-    except Exception as e:
-        if verbose:
-            print("synonyms 请求异常:", e)
-
-    # 2) 从 CID 获取 compound-specific 页面，提取 Record Description
-    compound_url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/{cid}/JSON"
-    if verbose:
-        print("Compound data URL:", compound_url)
+    # 同一 CID（盐型、立体异构、不同写法的 SMILES）只请求一次：在途请求共享，结果进 LRU
+    def _fetch(c):
+        return fetch_annotation_by_cid(c, retries=retries, backoff=backoff, verbose=verbose, limiter=limiter,
+                                       raise_on_failure=True)
 
-    for attempt in range(1, retries + 1):
+    if cid_memo is not None and cid:
         try:
-            r = requests.get(compound_url, timeout=12, headers=headers)
-            if verbose:
-                print(f"GET {r.url} -> {r.status_code}")
-            if r.status_code != 200:
-                if attempt == retries and verbose:
-                    print(f"CID {cid} compound page 非200: {r.status_code}")
-                time.sleep(min(backoff ** attempt + random.random(), 5))
-                continue
+            name, desc = cid_memo.get_or_fetch(cid, _fetch)
+        except FetchFailed as e:
+            name, desc = e.name, e.description
+    else:
+        name, desc = fetch_annotation_by_cid(cid, retries=retries, backoff=backoff, verbose=verbose, limiter=limiter)
+    return cid, name, desc
+
+class RateLimiter:
+    """
+    线程安全的请求节流：相邻两次 wait() 返回之间至少间隔 min_interval 秒。
+    多个 worker 共享一个实例即可共享同一速率限制。
+    """
 
-            data = r.json()
-            record = data.get("Record", {}) or {}
+    def __init__(self, min_interval=0.2):
+        self.min_interval = max(float(min_interval or 0), 0.0)
+        self._lock = threading.Lock()
+        self._next = 0.0
 
-            # 递归查找包含目标 heading 的 sections
-            def find_sections(sections, target="Record Description"):
-                res = []
-                for s in sections or []:
-                    # 多种字段名兼容
-                    heading = None
-                    toc = s.get("TOCHeading")
-                    if isinstance(toc, dict):
-                        heading = toc.get("#TOCHeading") or toc.get("TOCHeading")
-                    if not heading:
-                        heading = s.get("TOCHeading") or s.get("Heading")
-                    if heading and target.lower() in str(heading).lower():
-                        res.append(s)
-                    # 递归子 section（可能字段名不同）
-                    subs = s.get("Section") or s.get("Sections") or s.get("SectionList") or []
-                    if subs:
-                        res.extend(find_sections(subs, target=target))
-                return res
+    def wait(self):
+        with self._lock:
+            now = _time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.min_interval
+        if start > now:
+            _time.sleep(start - now)
 
-            sections = record.get("Section") or record.get("Sections") or []
-            rd_secs = find_sections(sections, target="Record Description")
-            if verbose:
-                print("Record Description sections found:", len(rd_secs))
+class CidMemo:
+    """
+    按 CID 的 single-flight 请求合并 + 有界 LRU 缓存（线程安全）。
+    同一 CID 的并发请求共享一个 Future，已完成的结果在 LRU 中复用。
+    fetch 抛出异常（如 FetchFailed）或返回 (None, None) 时不缓存，下次会重新请求；
+    在途时合并进来的请求共享这次失败。
+    """
 
-            # 文本提取器（递归，支持 StringWithMarkup / String / 嵌套结构）
-            def extract_texts_from_data(data_block):
-                texts = []
-                def _ext(o):
-                    if isinstance(o, dict):
-                        if "StringWithMarkup" in o:
-                            for itm in o["StringWithMarkup"] if isinstance(o["StringWithMarkup"], list) else []:
-                                if isinstance(itm, dict) and "String" in itm and isinstance(itm["String"], str):
-                                    texts.append(itm["String"])
-                        elif "String" in o and isinstance(o["String"], str):
-                            texts.append(o["String"])
-                        else:
-                            for v in o.values():
-                                _ext(v)
-                    elif isinstance(o, list):
-                        for it in o:
-                            _ext(it)
-                _ext(data_block)
-                return [t for t in texts if t and isinstance(t, str)]
+    def __init__(self, maxsize=100_000):
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def get_or_fetch(self, cid, fetch):
+        from concurrent.futures import Future
+
+        key = int(cid)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            fut = self._in_flight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._in_flight[key] = fut
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return fut.result()
 
-            # 在 Record Description sections 中提取第一个合理的 description
-            for sec in rd_secs:
-                # 常见位置：Information / InformationList / Data
-                infos = sec.get("Information") or sec.get("InformationList") or sec.get("Data") or []
-                if isinstance(infos, dict):
-                    infos = [infos]
-                for info in infos or []:
-                    # 信息块中可能有 Value / ValueList / Data
-                    val = info.get("Value") or info.get("ValueList") or info.get("Data") or info.get("ValueString")
-                    texts = extract_texts_from_data(val)
-                    if texts:
-                        desc = "\n".join(texts[:6])
-                        if verbose:
-                            print("Found Record Description (truncated):", desc[:200])
-                        return cid, (name or sec.get("TOCHeading") or sec.get("Heading")), desc
+        try:
+            result = fetch(cid)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            if result != (None, None) and self.maxsize > 0:
+                self._cache[key] = result
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        fut.set_result(result)
+        return result
+
+    def summary(self):
+        return f"CID memo: {self.hits} hits, {self.coalesced} coalesced, {self.misses} fetched"
+
+def _is_cid(item):
+    if isinstance(item, bool):
+        return False
+    if isinstance(item, int):
+        return item > 0
+    return str(item).strip().isdigit()
+
+def _annotate_one(item, kind, limiter, retries, backoff, verbose, description_store=None, cid_memo=None):
+    as_cid = _is_cid(item) if kind == "auto" else kind == "cid"
+    record = {"CID": None, "SMILES": None, "Name": None, "Description": None, "Error": None}
+    try:
+        if as_cid:
+            record["CID"] = int(str(item).strip())
+            # 与 fetch_annotation_by_smiles 一致：本地 store 已收录的 CID 不再请求
+            stored = description_store.get(record["CID"]) if description_store is not None else None
+            if stored is not None:
+                record["Name"], record["Description"] = stored
+                return record
+            try:
+                record["Name"], record["Description"] = cid_memo.get_or_fetch(
+                    record["CID"], lambda c: fetch_annotation_by_cid(c, retries=retries, backoff=backoff,
+                                                                     verbose=verbose, limiter=limiter,
+                                                                     raise_on_failure=True))
+            except FetchFailed as e:
+                record["Name"], record["Description"], record["Error"] = e.name, e.description, str(e)
+        else:
+            record["SMILES"] = item
+            record["CID"], record["Name"], record["Description"] = fetch_annotation_by_smiles(
+                item, retries=retries, backoff=backoff, verbose=verbose, description_store=description_store,
+                cid_memo=cid_memo, limiter=limiter)
+    except Exception as e:
+        record["Error"] = f"{type(e).__name__}: {e}"
+    return record
+
+def annotate_many(items,
+                  kind="auto",
+                  max_workers=4,
+                  max_in_flight=None,
+                  delay=0.2,
+                  ordered=False,
+                  retries=3,
+                  backoff=1.5,
+                  description_store=None,
+                  cid_memo=None,
+                  verbose=False):
+    """
+    Streaming annotation: yield one result record per input as it finishes.
 
-                # 有时 section 自身也直接包含 Data 字段
-                data_items = sec.get("Data") or sec.get("Information") or []
-                texts = extract_texts_from_data(data_items)
-                if texts:
-                    desc = "\n".join(texts[:6])
-                    if verbose:
-                        print("Found description in section fallback (truncated):", desc[:200])
-                    return cid, (name or sec.get("TOCHeading") or sec.get("Heading")), desc
+    items 可以是任意可迭代对象（SMILES 或 CID，惰性读取），最多 max_in_flight 个
+    请求同时在途；调用方不取结果时不会继续提交新的请求（背压）。
 
-            # 未找到 Record Description -> 返回 name（若有）并退出
+    Parameters:
+      items: SMILES / CID 的可迭代对象
+      kind: "auto"（纯数字视为 CID）/ "smiles" / "cid"
+      max_workers: 并发线程数
+      max_in_flight: 在途上限（默认 2 * max_workers）
+      delay: 相邻两次 HTTP 请求（SMILES→CID、synonyms、pug_view 及重试）的最小间隔（秒），所有线程共享
+      ordered: True 时按输入顺序产出，否则按完成顺序
+      description_store: 可选的本地 CID→description store（DescriptionStore 实例）
+      cid_memo: CidMemo 实例（默认每次调用新建一个）；传入自己的实例可跨调用复用并查看命中统计
+    Yields:
+      {"CID", "SMILES", "Name", "Description", "Error"} 字典
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if kind not in ("auto", "smiles", "cid"):
+        raise ValueError(f"kind must be 'auto', 'smiles' or 'cid', got {kind!r}")
+    limit = max(int(max_in_flight or 2 * max_workers), 1)
+    limiter = RateLimiter(delay)
+    cid_memo = cid_memo if cid_memo is not None else CidMemo()
+    source = iter(items)
+    exhausted = False
+    in_flight = set()
+    order = deque()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            while not exhausted and len(in_flight) < limit:
+                try:
+                    item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                fut = executor.submit(_annotate_one, item, kind, limiter, retries, backoff, verbose,
+                                      description_store, cid_memo)
+                in_flight.add(fut)
+                order.append(fut)
+            if not in_flight:
+                break
+            if ordered:
+                fut = order.popleft()
+                record = fut.result()
+                in_flight.discard(fut)
+                yield record
+            else:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    in_flight.discard(fut)
+                    yield fut.result()
+    finally:
+        # 调用方提前结束（break / close）时取消尚未开始的请求
+        for fut in in_flight:
+            fut.cancel()
+        executor.shutdown(wait=True)
+
+def _norm_smi(s):
+    if s is None:
+        return ""
+    try:
+        if pd.isna(s):
+            return ""
+    except Exception:
+        pass
+    s2 = str(s).strip()
+    # 去除常见的包裹符号
+    if (s2.startswith('"') and s2.endswith('"')) or (s2.startswith("'") and s2.endswith("'")):
+        s2 = s2[1:-1].strip()
+    return s2
+
+def _detect_smi_col(columns):
+    """智能识别结果表中的 SMILES 列名"""
+    for c in columns:
+        lc = str(c).lower()
+        if 'smiles' in lc or lc == 'smi' or 'smi' in lc:
+            return c
+    # fallback to first column named exactly 'SMILES' or 2nd column
+    return 'SMILES' if 'SMILES' in columns else columns[0]
+
+def _append_df_to_csv(path, df_to_append, header, verbose=False):
+    """
+    Append df to CSV atomically. 返回 (ok, err).
+    会在同目录写临时文件再原子替换，减少中途写入丢失的可能性。
+    """
+    import tempfile, shutil
+    try:
+        out_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(out_dir, exist_ok=True)
+        # 如果目标不存在且 header=True，则直接写（create）
+        if not os.path.exists(path) and header:
             if verbose:
-                print("No Record Description found in compound page for CID", cid)
-            return cid, name, None
+                print("Creating new CSV:", path)
+            df_to_append.to_csv(path, index=False, encoding='utf-8-sig', header=True)
+            return True, None
+        # 否则把追加内容写到临时文件，然后合并/追加到目标
+        # 临时文件写入后再用 append 模式写入目标（可改为读出并合并）
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix="._tmp_append_", suffix=".csv")
+        os.close(tmp_fd)
+        df_to_append.to_csv(tmp_path, index=False, encoding='utf-8-sig', header=False)
+        # 使用二进制方式追加临时文件到目标
+        with open(path, 'ab') as outf, open(tmp_path, 'rb') as inf:
+            shutil.copyfileobj(inf, outf)
+            try:
+                outf.flush()
+                os.fsync(outf.fileno())
+            except Exception:
+                pass
+        os.remove(tmp_path)
+        if verbose:
+            print("Appended chunk to", path)
+        return True, None
+    except Exception as e:
+        if verbose:
+            print("Append error:", e)
+        return False, e
 
-        except Exception as e:
-            if attempt == retries and verbose:
-                print(f"请求错误 {cid}: {e}")
-            time.sleep(min(backoff ** attempt + random.random(), 5))
+def _norm_col(c):
+    return re.sub(r'\s+', ' ', str(c)).strip().replace('\u00A0', ' ')
+
+def _sniff_sep(file_path, encoding):
+    """根据文件开头猜测分隔符（compact 模式下用 C 解析器，需要显式分隔符）"""
+    import csv
+    with open(file_path, 'r', encoding=encoding) as f:
+        head = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(head, delimiters=",\t;|").delimiter
+    except csv.Error:
+        return ","
+
+def _read_table(file_path, columns=None, nrows=None):
+    """
+    读取表格，兼容常见编码与分隔符，并规范化列名。
+    columns: 只保留这些（规范化后的）列，改用 C 解析器读取（compact 模式）
+    """
+    df = None
+    for enc in ("utf-8", "utf-8-sig", "gbk", "latin1"):
+        try:
+            if columns is None:
+                df = pd.read_csv(file_path, sep=None, engine='python', encoding=enc, nrows=nrows)
+            else:
+                df = pd.read_csv(file_path, sep=_sniff_sep(file_path, enc), encoding=enc, nrows=nrows,
+                                 usecols=lambda c: _norm_col(c) in columns, dtype=str)
+            break
+        except Exception:
+            df = None
+    if df is None:
+        raise RuntimeError(f"无法读取文件 {file_path}，请检查编码/格式。")
+    # 规范化列名
+    df.columns = [_norm_col(c) for c in df.columns]
+    return df
+
+def _find_col(columns, target, keywords=None):
+    if target in columns:
+        return target
+    low = target.lower()
+    for c in columns:
+        if low == str(c).lower():
+            return c
+    kws = keywords or [part for part in re.split(r'[\s_\-]+', target.lower()) if part]
+    for c in columns:
+        lc = str(c).lower()
+        if all(k in lc for k in kws):
+            return c
+    return None
+
+def _load_processed(out_path, compact=False, verbose=False, chunksize=100_000):
+    """
+    从已有输出加载已处理的 normalized SMILES（断点续跑）。
+    返回 (processed, header_needed)；compact 时 processed 为 HashedSet，且分块只读 SMILES 列。
+    """
+    processed = HashedSet() if compact else set()
+    if not os.path.exists(out_path):
+        return processed, True
+    try:
+        if compact:
+            smi_col = _detect_smi_col(pd.read_csv(out_path, encoding='utf-8-sig', nrows=0).columns)
+            n = 0
+            for chunk in pd.read_csv(out_path, encoding='utf-8-sig', usecols=[smi_col], dtype=str, chunksize=chunksize):
+                processed.update(chunk[smi_col].map(_norm_smi))
+                n += len(chunk)
+        else:
+            prev = pd.read_csv(out_path, encoding='utf-8-sig')
+            smi_col = _detect_smi_col(prev.columns)
+            for _, r in prev.iterrows():
+                processed.add(_norm_smi(r.get(smi_col)))
+            n = len(prev)
+        if verbose:
+            print(f"已加载 {n} 现有结果，将跳过这些 SMILES。")
+        return processed, False
+    except Exception:
+        if verbose:
+            print("无法读取已存在的输出文件，重新从头开始写入。")
+        return (HashedSet() if compact else set()), True
 
-    return cid, name, None
+def _carry_over_results(prev_path, out_path, keep, header, verbose=False):
+    """
+    把上一版本输出中 normalized SMILES 属于 keep 的行合并到新输出。
+    返回实际合并的 SMILES 集合。
+    """
+    try:
+        prev = pd.read_csv(prev_path, encoding='utf-8-sig')
+    except Exception as e:
+        if verbose:
+            print("无法读取上一版本输出:", e)
+        return set()
+    if prev.empty:
+        return set()
+    nsmis = prev[_detect_smi_col(prev.columns)].map(_norm_smi)
+    mask = nsmis.isin(keep) & ~nsmis.duplicated()
+    if not mask.any():
+        return set()
+    ok, err = _append_df_to_csv(out_path, prev[mask], header, verbose=verbose)
+    if not ok:
+        print("Error while carrying over previous results:", err, file=sys.stderr)
+        return set()
+    return set(nsmis[mask])
 
 def process_annotations(file_path,
                         cid_name=None,
@@ -329,6 +634,12 @@ def process_annotations(file_path,
                         max_rows=None,
                         sample=False,
                         batch_start=None,
+                        manifest_path=None,
+                        compact=False,
+                        checkpoint_path=None,
+                        grace_period=30,
+                        description_store=None,
+                        cid_memo_size=100_000,
                         verbose=False):
     """
     Batch process annotations with resume support.
@@ -343,51 +654,49 @@ def process_annotations(file_path,
       max_rows: 最多处理多少条（None 为全部）
       sample: 若为 True 且 max_rows 不为 None，则随机抽样 max_rows 条
       batch_start: 手动指定从哪个索引开始（用于跳过前若干行）
+      manifest_path: 运行清单路径；给出时做增量运行，只请求相对上一版本新增/变更的行，
+                     未变化的结果从上一版本输出合并过来
+      compact: 省内存模式（适合千万行级输入）：只读取需要的列，标识列保存为 numpy 数组，
+               索引惰性迭代，已处理集合保存为 64 位哈希（HashedSet）
+      checkpoint_path: 每次写盘及结束/中断时写入的 checkpoint（JSON）路径
+      grace_period: 收到 SIGINT/SIGTERM 后等待在途请求完成的最长秒数
+      description_store: 本地 CID→description store 路径（python -m src.harvest 生成），
+                         已收录的 CID 不再请求 synonyms / pug_view
+      cid_memo_size: 按 CID 缓存结果的 LRU 容量（0 关闭）；不同 SMILES 解析到同一 CID 时不再重复请求
       verbose: 输出调试信息
     """
 
-    # 读取表格，兼容常见编码与分隔符
-    df = None
-    for enc in ("utf-8", "utf-8-sig", "gbk", "latin1"):
-        try:
-            df = pd.read_csv(file_path, sep=None, engine='python', encoding=enc)
-            break
-        except Exception:
-            df = None
-    if df is None:
-        raise RuntimeError(f"无法读取文件 {file_path}，请检查编码/格式。")
-
-    # 规范化列名
-    df.columns = [re.sub(r'\s+', ' ', str(c)).strip().replace('\u00A0', ' ') for c in df.columns]
+    if compact:
+        # 先读表头确定列，再只读取需要的列
+        header = _read_table(file_path, nrows=100)
+        columns = header.columns
+    else:
+        df = _read_table(file_path)
+        columns = df.columns
     if verbose:
-        print("Detected columns:", df.columns.tolist())
-
-    def find_col(target, keywords=None):
-        if target in df.columns:
-            return target
-        low = target.lower()
-        for c in df.columns:
-            if low == str(c).lower():
-                return c
-        kws = keywords or [part for part in re.split(r'[\s_\-]+', target.lower()) if part]
-        for c in df.columns:
-            lc = str(c).lower()
-            if all(k in lc for k in kws):
-                return c
-        return None
-
-    cid_col = find_col(cid_name, keywords=['cid', 'pubchem']) if cid_name is not None else None
-    smiles_col = find_col(smiles_name, keywords=['smiles', 'csmiles', 'smile', 'cleaned_smiles']) if smiles_name is not None else None
-    if cid_col is None and smiles_col is None:
-        raise KeyError(f"找不到列。期望: '{cid_name}' 和 '{smiles_name}'。可用列: {df.columns.tolist()}")
+        print("Detected columns:", columns.tolist())
 
-    if cid_col is not None:
-        cid_list = df[cid_col].astype(str).tolist()
-    if smiles_col is not None:
-        smiles_list = df[smiles_col].astype(str).tolist()
+    cid_col = _find_col(columns, cid_name, keywords=['cid', 'pubchem']) if cid_name is not None else None
+    smiles_col = _find_col(columns, smiles_name, keywords=['smiles', 'csmiles', 'smile', 'cleaned_smiles']) if smiles_name is not None else None
+    if cid_col is None and smiles_col is None:
+        raise KeyError(f"找不到列。期望: '{cid_name}' 和 '{smiles_name}'。可用列: {columns.tolist()}")
+
+    if compact:
+        df = _read_table(file_path, columns={c for c in (cid_col, smiles_col) if c is not None})
+        # 直接引用列的 numpy 数组，不再复制成 Python list
+        if cid_col is not None:
+            cid_list = df[cid_col].to_numpy()
+        if smiles_col is not None:
+            smiles_list = df[smiles_col].to_numpy()
+        del df
+    else:
+        if cid_col is not None:
+            cid_list = df[cid_col].astype(str).tolist()
+        if smiles_col is not None:
+            smiles_list = df[smiles_col].astype(str).tolist()
 
     total = len(smiles_list)
-    indices = list(range(total))
+    indices = range(total) if compact else list(range(total))
 
     # 按 max_rows / sample 筛选索引
     if isinstance(max_rows, int) and max_rows > 0:
@@ -400,134 +709,168 @@ def process_annotations(file_path,
     if start_idx < 0:
         start_idx = 0
 
-    processed = set()
-    header_needed = True
     # 确保 out_path 有默认值
     if out_path is None:
         out_path = os.path.splitext(file_path)[0] + "_smiles_annotation关联结果.csv"
-    def _norm_smi(s):
-        if s is None:
-            return ""
-        try:
-            if pd.isna(s):
-                return ""
-        except Exception:
-            pass
-        s2 = str(s).strip()
-        # 去除常见的包裹符号
-        if (s2.startswith('"') and s2.endswith('"')) or (s2.startswith("'") and s2.endswith("'")):
-            s2 = s2[1:-1].strip()
-        return s2
-
-    if os.path.exists(out_path):
-        try:
-            prev = pd.read_csv(out_path, encoding='utf-8-sig')
-            # 智能识别 SMILES 列名
-            smi_col = None
-            for c in prev.columns:
-                lc = str(c).lower()
-                if 'smiles' in lc or lc == 'smi' or 'smi' in lc:
-                    smi_col = c
-                    break
-            if smi_col is None:
-                # fallback to first column named exactly 'SMILES' or 2nd column
-                smi_col = 'SMILES' if 'SMILES' in prev.columns else prev.columns[0]
-            for _, r in prev.iterrows():
-                processed.add(_norm_smi(r.get(smi_col)))
-            header_needed = False
-            if verbose:
-                print(f"已加载 {len(prev)} 现有结果，将跳过这些 SMILES。")
-        except Exception:
-            if verbose:
-                print("无法读取已存在的输出文件，重新从头开始写入。")
-            processed = set()
-            header_needed = True
 
-    def _append_df_to_csv(path, df_to_append, header, verbose=False):
-        """
-        Append df to CSV atomically. 返回 (ok, err).
-        会在同目录写临时文件再原子替换，减少中途写入丢失的可能性。
-        """
-        import tempfile, shutil
-        try:
-            out_dir = os.path.dirname(os.path.abspath(path))
-            os.makedirs(out_dir, exist_ok=True)
-            # 如果目标不存在且 header=True，则直接写（create）
-            if not os.path.exists(path) and header:
-                if verbose:
-                    print("Creating new CSV:", path)
-                df_to_append.to_csv(path, index=False, encoding='utf-8-sig', header=True)
-                return True, None
-            # 否则把追加内容写到临时文件，然后合并/追加到目标
-            # 临时文件写入后再用 append 模式写入目标（可改为读出并合并）
-            tmp_fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix="._tmp_append_", suffix=".csv")
-            os.close(tmp_fd)
-            df_to_append.to_csv(tmp_path, index=False, encoding='utf-8-sig', header=False)
-            # 使用二进制方式追加临时文件到目标
-            with open(path, 'ab') as outf, open(tmp_path, 'rb') as inf:
-                shutil.copyfileobj(inf, outf)
-                try:
-                    outf.flush()
-                    os.fsync(outf.fileno())
-                except Exception:
-                    pass
-            os.remove(tmp_path)
-            if verbose:
-                print("Appended chunk to", path)
-            return True, None
-        except Exception as e:
-            if verbose:
-                print("Append error:", e)
-            return False, e
+    processed, header_needed = _load_processed(out_path, compact=compact, verbose=verbose)
+
+    store = None
+    if description_store is not None:
+        from .harvest import DescriptionStore
+        store = DescriptionStore(description_store) if isinstance(description_store, str) else description_store
+        print(f"使用本地 description store：{len(store)} 个 CID")
+    cid_memo = CidMemo(cid_memo_size) if cid_memo_size else None
+
+    # 增量运行：与上一输入版本的运行清单比对
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    outcomes = {}
+    moved_out = None
+    if manifest is not None:
+        # 按整个输入比对（max_rows / sample / batch_start 只限制本次请求的行）
+        row_keys = {}
+        for i in range(total):
+            nsmi = _norm_smi(smiles_list[i])
+            row_keys[nsmi] = row_fingerprint(nsmi, cid_list[i] if cid_col is not None else None)
+        hits, misses, todo = manifest.diff(row_keys.items())
+        prev_out = manifest.output
+        # 输出按清单重建：已有输出先移到一边，只合并仍然有效的行，变更和已删除的行不保留
+        if os.path.exists(out_path):
+            moved_out = out_path + ".prev"
+            os.replace(out_path, moved_out)
+            if prev_out and os.path.abspath(prev_out) == os.path.abspath(out_path):
+                prev_out = moved_out
+            processed = HashedSet() if compact else set()
+            header_needed = True
+        # 清单中没有记录的新行若已在现有输出里，视为本版本中断前已完成的结果
+        keep = hits | {nsmi for nsmi in todo if nsmi not in manifest.entries}
+        for src in dict.fromkeys(p for p in (prev_out, moved_out) if p):
+            carry = {nsmi for nsmi in keep if nsmi not in processed}
+            if not carry or not os.path.exists(src):
+                continue
+            carried = _carry_over_results(src, out_path, carry, header_needed, verbose=verbose)
+            if carried:
+                header_needed = False
+            processed |= carried
+        # 未变化且上次无结果的行不再请求
+        processed |= misses
+        refetch = sum(1 for nsmi in todo if nsmi not in processed)
+        print(f"增量运行：新增/变更 {refetch}，沿用结果 {len(row_keys) - refetch - len(misses)}，"
+              f"沿用空结果 {len(misses)}。")
 
     buffer = []
     total_to_process = len(indices) - start_idx
     pbar = tqdm(indices[start_idx:], total=total_to_process, desc="Processing smiles")
+    started = _time.strftime("%Y-%m-%d %H:%M:%S")
+    position = start_idx - 1  # indices 中最后一个处理完的位置
 
     if verbose:
         print("Output CSV path:", out_path)
 
-    # 主循环
-    for i in pbar:
-        smiles = smiles_list[i]
-        # 归一化并跳过已处理的
-        nsmi = _norm_smi(smiles)
-        if nsmi in processed:
-            if verbose:
-                print(f"跳过已处理 SMILES (index {i}): {nsmi}")
-            continue
-
-        cid, name, description = fetch_annotation_by_smiles(smiles, verbose=verbose)
-
-        if name or description:
-            buffer.append({"CID": cid, "SMILES": smiles, "Name": name, "Description": description})
-            processed.add(str(smiles))
-
-        # 周期性保存
-        if len(buffer) >= save_every:
+    def flush(final=False):
+        nonlocal buffer, header_needed
+        if buffer:
             if verbose:
                 print(f"About to save {len(buffer)} records to {out_path} (append={os.path.exists(out_path)}, header_needed={header_needed})")
             df_out = pd.DataFrame(buffer)
             ok, err = _append_df_to_csv(out_path, df_out, header_needed)
             if not ok:
-                print("Error while saving append:", err, file=sys.stderr)
+                print("Error while saving final chunk:" if final else "Error while saving append:", err, file=sys.stderr)
             else:
                 header_needed = False
                 if verbose:
-                    print(f"Saved {len(buffer)} records to {out_path} (append).")
+                    print(f"Saved {'final ' if final else ''}{len(buffer)} records to {out_path}.")
             buffer = []
+        if checkpoint_path:
+            save_state({"current_state": {
+                "input_path": file_path,
+                "out_path": out_path,
+                "total_cids": len(indices),
+                "last_processed_index": position,
+                "next_batch_start": position + 1,
+                "is_running": not final,
+                "interrupted": shutdown.stop_requested or interrupted,
+                "start_time": started,
+                "end_time": _time.strftime("%Y-%m-%d %H:%M:%S") if final else None,
+            }}, checkpoint_path)
+
+    def save_manifest():
+        entries = {}
+        for nsmi, fp in row_keys.items():
+            outcome = outcomes.get(nsmi)
+            if outcome is None and nsmi in misses:
+                outcome = MISS
+            elif outcome is None and nsmi in processed:
+                outcome = HIT
+            if outcome is not None:
+                entries[nsmi] = [fp, outcome]
+            elif nsmi in manifest.entries:
+                # 本次未处理到的行（max_rows / sample / 中断）保留原记录，下次仍按变更处理
+                entries[nsmi] = manifest.entries[nsmi]
+        manifest.update(entries, file_path, out_path)
+        manifest.save()
+        if moved_out is not None and os.path.exists(moved_out):
+            os.remove(moved_out)
+        if verbose:
+            print(f"Run manifest saved to {manifest_path} ({len(entries)} rows).")
 
-        _time.sleep(delay)
-
-    # 保存剩余
-    if buffer:
-        df_out = pd.DataFrame(buffer)
-        ok, err = _append_df_to_csv(out_path, df_out, header_needed)
-        if not ok:
-            print("Error while saving final chunk:", err, file=sys.stderr)
-        else:
-            if verbose:
-                print(f"Saved final {len(buffer)} records to {out_path}.")
-
-    print("Processing complete. Results saved to:", out_path)
+    # 主循环；SIGINT/SIGTERM 时停止派发新请求，处理完在途请求后写盘退出
+    shutdown = GracefulShutdown(grace=grace_period)
+    interrupted = False
+    with shutdown:
+        try:
+            for i in pbar:
+                if shutdown.stop_requested:
+                    break
+                smiles = smiles_list[i]
+                # 归一化并跳过已处理的
+                nsmi = _norm_smi(smiles)
+                if nsmi in processed:
+                    if verbose:
+                        print(f"跳过已处理 SMILES (index {i}): {nsmi}")
+                    position += 1
+                    continue
+
+                cid, name, description = fetch_annotation_by_smiles(smiles, verbose=verbose, description_store=store,
+                                                                    cid_memo=cid_memo)
+
+                with shutdown.critical():
+                    if name or description:
+                        buffer.append({"CID": cid, "SMILES": smiles, "Name": name, "Description": description})
+                        processed.add(nsmi)
+                    if manifest is not None and cid is not None:
+                        outcomes[nsmi] = HIT if (name or description) else MISS
+                    position += 1
+
+                    # 周期性保存
+                    if len(buffer) >= save_every:
+                        flush()
+
+                _time.sleep(delay)
+        except KeyboardInterrupt:
+            interrupted = True
+            print("宽限期内未完成在途请求，已放弃当前请求。", file=sys.stderr)
+        finally:
+            pbar.close()
+
+        # 保存剩余（缓冲区、最终 checkpoint、运行清单）；仍在信号处理之内，再次中断推迟到写完之后
+        try:
+            with shutdown.critical():
+                flush(final=True)
+                if manifest is not None:
+                    save_manifest()
+        except KeyboardInterrupt:
+            interrupted = True
+
+    if cid_memo is not None:
+        print(cid_memo.summary() + ".")
+    if store is not None:
+        print(f"Description store: {store.hits} hits, {store.misses} misses (per-CID requests).")
+        if isinstance(description_store, str):
+            store.close()
+
+    if shutdown.stop_requested or interrupted:
+        print(f"Processing stopped after index position {position}. Results saved to:", out_path)
+    else:
+        print("Processing complete. Results saved to:", out_path)
     return out_path
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Graceful SIGINT/SIGTERM handling for the batch entry points.
+
+第一次信号：只设置 stop_requested，调用方停止派发新请求，让在途请求完成；
+若 grace 秒后仍未退出，则在主线程抛出 KeyboardInterrupt。
+第二次信号：立即抛出 KeyboardInterrupt。
+critical() 包住的代码（如写盘）不会被打断，中断推迟到其结束后再抛出。
+"""
+import _thread
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+
+class GracefulShutdown:
+
+    def __init__(self, grace=30.0, signals=(signal.SIGINT, signal.SIGTERM)):
+        self.grace = grace
+        self.signals = [s for s in signals if s is not None]
+        self.stop_requested = False
+        self.signum = None
+        self._previous = {}
+        self._timer = None
+        self._critical = 0
+        self._pending_interrupt = False
+
+    def __enter__(self):
+        # signal.signal 只能在主线程调用；其它线程里退化为普通上下文
+        if threading.current_thread() is threading.main_thread():
+            for s in self.signals:
+                self._previous[s] = signal.signal(s, self._handle)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for s, handler in self._previous.items():
+            signal.signal(s, handler)
+        self._previous = {}
+        return False
+
+    def request_stop(self, signum=None):
+        if self.stop_requested:
+            return
+        self.stop_requested = True
+        self.signum = signum
+        name = signal.Signals(signum).name if signum else "stop"
+        print(f"\n收到 {name}：停止派发新请求，最多等待 {self.grace}s 让在途请求完成并写盘。"
+              "再次发送信号将立即中断。", file=sys.stderr)
+        if self.grace is not None and self._previous:
+            self._timer = threading.Timer(self.grace, self._interrupt_main)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @staticmethod
+    def _interrupt_main():
+        # 向主线程发送真实信号，才能打断阻塞中的 sleep / socket 读
+        if hasattr(signal, "pthread_kill"):
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+        else:
+            _thread.interrupt_main()
+
+    def _handle(self, signum, frame):
+        if not self.stop_requested:
+            self.request_stop(signum)
+            return
+        if self._critical:
+            self._pending_interrupt = True
+            return
+        raise KeyboardInterrupt
+
+    @contextmanager
+    def critical(self):
+        """写盘等不可打断的区段：期间的强制中断推迟到区段结束后。"""
+        self._critical += 1
+        try:
+            yield
+        finally:
+            self._critical -= 1
+            if not self._critical and self._pending_interrupt:
+                self._pending_interrupt = False
+                raise KeyboardInterrupt
@@ -1,5 +1,8 @@
 def save_state(state, filepath):
     import json
+    import os
+    # checkpoint 默认是相对路径（checkpoints/state.json），目录不一定存在
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(state, f, ensure_ascii=False, indent=4)
 
@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+from src import pubchem
+
+
+def _fake_smiles(smiles, **kwargs):
+    return len(smiles), f"name-{smiles}", None
+
+
+def _fake_cid(cid, **kwargs):
+    return f"cid-{cid}", "desc"
+
+
+class TestAnnotateMany(unittest.TestCase):
+
+    def setUp(self):
+        patches = [mock.patch.object(pubchem, "fetch_annotation_by_smiles", side_effect=_fake_smiles),
+                   mock.patch.object(pubchem, "fetch_annotation_by_cid", side_effect=_fake_cid)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_ordered_mixed_inputs(self):
+        records = list(pubchem.annotate_many(["CCO", 2244, "702", "CCCN"], delay=0, ordered=True))
+        self.assertEqual([r["Name"] for r in records], ["name-CCO", "cid-2244", "cid-702", "name-CCCN"])
+        self.assertEqual(records[0]["CID"], 3)
+        self.assertEqual(records[2]["CID"], 702)
+        self.assertTrue(all(r["Error"] is None for r in records))
+
+    def test_backpressure(self):
+        pulled = []
+
+        def source():
+            for i in range(100):
+                pulled.append(i)
+                yield f"C{i}"
+
+        stream = pubchem.annotate_many(source(), max_workers=2, max_in_flight=3, delay=0)
+        next(stream)
+        # 只取了一条结果：最多提交 max_in_flight 个，再补一个
+        self.assertLessEqual(len(pulled), 4)
+        stream.close()
+        self.assertLessEqual(len(pulled), 4)
+
+    def test_error_is_reported_per_record(self):
+        with mock.patch.object(pubchem, "fetch_annotation_by_smiles", side_effect=RuntimeError("boom")):
+            records = list(pubchem.annotate_many(["CCO"], kind="smiles", delay=0))
+        self.assertEqual(records[0]["Error"], "RuntimeError: boom")
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_every_request_waits_on_limiter(self):
+        limiter = mock.Mock()
+        post = mock.Mock(status_code=200, text="702")
+        get = mock.Mock(return_value=mock.Mock(status_code=503))
+        with mock.patch.object(pubchem.requests, "post", return_value=post), \
+                mock.patch.object(pubchem.requests, "get", get), \
+                mock.patch.object(pubchem.time, "sleep"):
+            pubchem.fetch_annotation_by_smiles("CCO", retries=2, limiter=limiter)
+        # SMILES→CID + synonyms + 2 次 pug_view（含重试）
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(limiter.wait.call_count, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
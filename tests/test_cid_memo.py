@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import pubchem
+from src.pubchem import CidMemo
+
+
+class TestCidMemo(unittest.TestCase):
+
+    def test_concurrent_requests_share_one_fetch(self):
+        memo = CidMemo()
+        calls = []
+        release = threading.Event()
+
+        def slow_fetch(cid):
+            calls.append(cid)
+            release.wait(5)
+            return "name", "desc"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(memo.get_or_fetch(702, slow_fetch)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        while memo.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(calls, [702])
+        self.assertEqual(results, [("name", "desc")] * 5)
+        self.assertEqual(memo.get_or_fetch("702", slow_fetch), ("name", "desc"))
+        self.assertEqual((memo.misses, memo.coalesced, memo.hits), (1, 4, 1))
+
+    def test_lru_bound_and_failures_not_cached(self):
+        memo = CidMemo(maxsize=2)
+        fetch = mock.Mock(side_effect=lambda cid: (f"n{cid}", None) if cid != 3 else (None, None))
+        for cid in (1, 2, 1, 4, 2, 3, 3):
+            memo.get_or_fetch(cid, fetch)
+        # 2 被 4 挤出 LRU；3 的空结果不缓存
+        self.assertEqual([c.args[0] for c in fetch.call_args_list], [1, 2, 4, 2, 3, 3])
+
+    def test_smiles_resolving_to_same_cid_fetch_once(self):
+        memo = CidMemo()
+        post = mock.Mock(status_code=200, text="5280343")
+        with mock.patch.object(pubchem.requests, "post", return_value=post), \
+                mock.patch.object(pubchem, "fetch_annotation_by_cid", return_value=("quercetin", "d")) as by_cid:
+            for smi in ("O=C1C(O)=C(OC2=CC(O)=CC(O)=C12)C1=CC(O)=C(O)C=C1",
+                        "C1=CC(=C(C=C1C2=C(C(=O)C3=C(C=C(C=C3O2)O)O)O)O)O"):
+                self.assertEqual(pubchem.fetch_annotation_by_smiles(smi, cid_memo=memo),
+                                 (5280343, "quercetin", "d"))
+        self.assertEqual(by_cid.call_count, 1)
+        self.assertEqual(memo.hits, 1)
+
+    def test_failed_compound_page_not_cached(self):
+        memo = CidMemo()
+        syn = mock.Mock(status_code=200, json=lambda: {"InformationList": {"Information": [{"Synonym": ["ethanol"]}]}})
+        empty = mock.Mock(status_code=200, json=lambda: {"Record": {"Section": []}})
+        # 第一次 pug_view 失败（503），第二次成功但没有 description
+        responses = iter([syn, mock.Mock(status_code=503), syn, empty, syn, empty])
+        with mock.patch.object(pubchem.requests, "post", return_value=mock.Mock(status_code=200, text="702")), \
+                mock.patch.object(pubchem.requests, "get", side_effect=lambda *a, **k: next(responses)) as get, \
+                mock.patch.object(pubchem.time, "sleep"):
+            for _ in range(3):
+                self.assertEqual(pubchem.fetch_annotation_by_smiles("CCO", retries=1, cid_memo=memo),
+                                 (702, "ethanol", None))
+        # 失败不缓存；"没有 description" 是正常结果，第三次命中缓存
+        self.assertEqual(get.call_count, 4)
+        self.assertEqual((memo.misses, memo.hits), (2, 1))
+
+    def test_failed_synonyms_not_cached(self):
+        memo = CidMemo()
+        syn = mock.Mock(status_code=200, json=lambda: {"InformationList": {"Information": [{"Synonym": ["ethanol"]}]}})
+        page = mock.Mock(status_code=200, json=lambda: {"Record": {"Section": [{
+            "TOCHeading": "Record Description",
+            "Information": [{"Value": {"StringWithMarkup": [{"String": "Ethanol is an alcohol."}]}}]}]}})
+        # 第一次 synonyms 503：name 退回为标题，不能缓存给后面的 SMILES
+        responses = iter([mock.Mock(status_code=503), page, syn, page])
+        with mock.patch.object(pubchem.requests, "post", return_value=mock.Mock(status_code=200, text="702")), \
+                mock.patch.object(pubchem.requests, "get", side_effect=lambda *a, **k: next(responses)) as get:
+            first = pubchem.fetch_annotation_by_smiles("CCO", retries=1, cid_memo=memo)
+            second = pubchem.fetch_annotation_by_smiles("OCC", retries=1, cid_memo=memo)
+            third = pubchem.fetch_annotation_by_smiles("C(O)C", retries=1, cid_memo=memo)
+        self.assertEqual(first, (702, "Record Description", "Ethanol is an alcohol."))
+        self.assertEqual(second, (702, "ethanol", "Ethanol is an alcohol."))
+        self.assertEqual(third, second)
+        self.assertEqual(get.call_count, 4)
+        self.assertEqual((memo.misses, memo.hits), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
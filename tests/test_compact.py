@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.compact import compact_results, CidIndex
+
+
+class TestCompact(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.a = os.path.join(self.dir, "a.csv")
+        pd.DataFrame([
+            {"CID": 702, "SMILES": "CCO", "Name": "ethanol", "Description": "short"},
+            {"CID": 5, "SMILES": "C(=O)O", "Name": "x", "Description": "line1\nline2, with comma"},
+            {"CID": 702, "SMILES": '"CCO"', "Name": "ethanol", "Description": "a longer description"},
+            {"CID": None, "SMILES": "XX", "Name": "n", "Description": None},
+        ]).to_csv(self.a, index=False, encoding="utf-8-sig")
+        self.b = os.path.join(self.dir, "b.jsonl")
+        with open(self.b, "w", encoding="utf-8") as f:
+            for rec in [{"CID": 702, "SMILES": "CCO", "Name": "ethanol", "Description": "last"},
+                        {"CID": 100, "SMILES": "CC", "Name": "ethane", "Description": "d"}]:
+                f.write(json.dumps(rec) + "\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _compact(self, keep, chunksize=2):
+        out = os.path.join(self.dir, f"out_{keep}.csv")
+        # chunksize=2 + fan_in=2 走多个 run 和多轮归并
+        n_in, n_out = compact_results([self.a, self.b], out, keep=keep, chunksize=chunksize, fan_in=2)
+        return out, pd.read_csv(out, encoding="utf-8-sig", dtype=str, keep_default_na=False), n_in, n_out
+
+    def test_dedupe_and_sort(self):
+        out, df, n_in, n_out = self._compact("first")
+        self.assertEqual((n_in, n_out), (6, 4))
+        self.assertEqual(df["CID"].tolist(), ["5", "100", "702", ""])
+        self.assertEqual(df.loc[df["CID"] == "702", "Description"].item(), "short")
+
+    def test_keep_policies(self):
+        _, last, _, _ = self._compact("last")
+        self.assertEqual(last.loc[last["CID"] == "702", "Description"].item(), "last")
+        _, longest, _, _ = self._compact("longest")
+        self.assertEqual(longest.loc[longest["CID"] == "702", "Description"].item(), "a longer description")
+
+    def test_index_lookup(self):
+        out, _, _, _ = self._compact("first")
+        index = CidIndex(out)
+        self.assertEqual(index.lookup(5)[0]["Description"], "line1\nline2, with comma")
+        self.assertEqual(index.lookup("100")[0]["Name"], "ethane")
+        self.assertEqual(index.lookup(12345), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import harvest, pubchem
+from src.harvest import DescriptionStore, harvest_descriptions
+
+
+def _page(page, total, annotations):
+    return {"Annotations": {"Annotation": annotations, "Page": page, "TotalPages": total}}
+
+
+def _ann(cids, text, name="n"):
+    return {"Name": name, "SourceName": "src", "LinkedRecords": {"CID": cids},
+            "Data": [{"Value": {"StringWithMarkup": [{"String": text}]}}]}
+
+
+PAGES = {
+    1: _page(1, 2, [_ann([702], "Ethanol is a primary alcohol.", "Ethanol"), _ann([5], "five")]),
+    2: _page(2, 2, [_ann([702], "second source"), _ann([2244, 999], "Aspirin", "Aspirin")]),
+}
+
+
+class TestHarvest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmp.name, "desc.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resumable_harvest_and_store_join(self):
+        fetched = []
+
+        def fake_page(page, **kwargs):
+            fetched.append(page)
+            return PAGES[page]
+
+        with mock.patch.object(harvest, "fetch_annotation_page", side_effect=fake_page):
+            self.assertEqual(harvest_descriptions(self.store_path, delay=0, max_pages=1), 1)
+            # 续跑只下载剩余的页
+            self.assertEqual(harvest_descriptions(self.store_path, delay=0), 1)
+            self.assertEqual(harvest_descriptions(self.store_path, delay=0), 0)
+        self.assertEqual(fetched, [1, 2])
+
+        store = DescriptionStore(self.store_path)
+        try:
+            self.assertEqual(len(store), 4)
+            self.assertEqual(store.get(702), ("Ethanol", "Ethanol is a primary alcohol."))
+            self.assertIsNone(store.get(1))
+
+            post = mock.Mock(status_code=200, text="2244\n")
+            with mock.patch.object(pubchem.requests, "post", return_value=post), \
+                    mock.patch.object(pubchem.requests, "get") as get:
+                cid, name, desc = pubchem.fetch_annotation_by_smiles("CC(=O)OC1=CC=CC=C1C(=O)O",
+                                                                     description_store=store)
+            self.assertEqual((cid, name, desc), (2244, "Aspirin", "Aspirin"))
+            get.assert_not_called()
+        finally:
+            store.close()
+
+    def test_annotate_many_cid_inputs_use_store(self):
+        with mock.patch.object(harvest, "fetch_annotation_page", side_effect=lambda page, **kwargs: PAGES[page]):
+            harvest_descriptions(self.store_path, delay=0)
+        store = DescriptionStore(self.store_path)
+        try:
+            with mock.patch.object(pubchem.requests, "get") as get:
+                records = list(pubchem.annotate_many([702, "2244"], delay=0, ordered=True, description_store=store))
+            get.assert_not_called()
+            self.assertEqual([(r["CID"], r["Name"]) for r in records], [(702, "Ethanol"), (2244, "Aspirin")])
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
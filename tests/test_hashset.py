@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import pubchem
+from src.hashset import HashedSet
+
+
+class TestHashedSet(unittest.TestCase):
+
+    def test_membership(self):
+        hs = HashedSet(["CCO", "CCN"], merge_every=2)
+        hs.add("CCC")
+        hs.add("CCO")
+        hs.add("C=O")  # 触发合并
+        for s in ("CCO", "CCN", "CCC", "C=O"):
+            self.assertIn(s, hs)
+        self.assertNotIn("CCCl", hs)
+        self.assertEqual(len(hs), 4)
+
+
+class TestCompactMode(unittest.TestCase):
+
+    def test_compact_resume_matches_default(self):
+        with tempfile.TemporaryDirectory() as d:
+            file_path = os.path.join(d, "in.tsv")
+            pd.DataFrame({"CID": [1, 2, 3, 4], "SMILES": ["CCO", "CCN", "CCC", "C=O"],
+                          "Herb": ["a", "b", "c", "d"]}).to_csv(file_path, sep="\t", index=False)
+            for compact in (False, True):
+                out_path = os.path.join(d, f"out_{compact}.csv")
+                pd.DataFrame([{"CID": 1, "SMILES": '"CCO"', "Name": "n", "Description": "d"}]).to_csv(
+                    out_path, index=False, encoding="utf-8-sig")
+                with mock.patch.object(pubchem, "fetch_annotation_by_smiles",
+                                       side_effect=lambda s, **kwargs: (1, "n", "d")) as fetch:
+                    pubchem.process_annotations(file_path, cid_name="CID", smiles_name="SMILES",
+                                                out_path=out_path, delay=0, compact=compact)
+                self.assertEqual([c.args[0] for c in fetch.call_args_list], ["CCN", "CCC", "C=O"])
+                self.assertEqual(len(pd.read_csv(out_path, encoding="utf-8-sig")), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import signal
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import pubchem
+from src.jobs import JobTable, init_jobs, run_worker, merge_shards
+
+
+class TestJobTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = os.path.join(self.dir, "jobs.sqlite")
+        file_path = os.path.join(self.dir, "in.csv")
+        smiles = ["CCO", "CCN", "CCO", "CCC", "C=O", "CCCl", "CO"]
+        pd.DataFrame({"Herb": ["h"] * len(smiles), "SMILES": smiles}).to_csv(file_path, index=False)
+        init_jobs(self.db, file_path, smiles_name="SMILES", batch_size=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_claims_are_exclusive_and_expired_leases_reclaimed(self):
+        a, b = JobTable(self.db), JobTable(self.db)
+        try:
+            batch_a, rows_a = a.claim("a", lease_seconds=600)
+            batch_b, _ = b.claim("b", lease_seconds=600)
+            self.assertNotEqual(batch_a, batch_b)
+            self.assertEqual([r[1] for r in rows_a], ["CCO", "CCN"])
+            self.assertTrue(a.renew(batch_a, "a", lease_seconds=-1))  # 模拟 a 的租约过期
+            # a 的租约已过期，b 重新领取到同一批次
+            self.assertEqual(b.claim("b", lease_seconds=600)[0], batch_a)
+            self.assertFalse(a.complete(batch_a, "a", "x.csv"))
+            self.assertTrue(b.complete(batch_a, "b", "x.csv"))
+        finally:
+            a.close()
+            b.close()
+
+    def test_workers_and_merge(self):
+        fetch = mock.patch.object(pubchem, "fetch_annotation_by_smiles",
+                                  side_effect=lambda s, **kwargs: (len(s), s.lower(), None))
+        with fetch as m:
+            self.assertEqual(run_worker(self.db, worker_id="w1", delay=0, max_batches=1), 1)
+            self.assertEqual(run_worker(self.db, worker_id="w2", delay=0), 2)
+        self.assertEqual(m.call_count, 6)
+        out_path = os.path.join(self.dir, "out.csv")
+        merge_shards(self.db, out_path)
+        result = pd.read_csv(out_path, encoding="utf-8-sig")
+        self.assertEqual(result["SMILES"].tolist(), ["CCO", "CCN", "CCC", "C=O", "CCCl", "CO"])
+
+    def test_interrupted_worker_releases_batch(self):
+        def fake_fetch(smiles, **kwargs):
+            if smiles == "CCO":
+                os.kill(os.getpid(), signal.SIGTERM)
+            return len(smiles), smiles, None
+
+        with mock.patch.object(pubchem, "fetch_annotation_by_smiles", side_effect=fake_fetch) as m:
+            self.assertEqual(run_worker(self.db, worker_id="w1", delay=0, grace_period=5), 0)
+        # 在途的 CCO 完成后停止，批次交还而不是等租约过期
+        self.assertEqual(m.call_count, 1)
+        table = JobTable(self.db)
+        try:
+            self.assertEqual(table.claim("w2", lease_seconds=600)[0], 0)
+        finally:
+            table.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
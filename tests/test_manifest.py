@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import pubchem
+from src.manifest import RunManifest, row_fingerprint, HIT, MISS
+
+
+def _fake_fetch(smiles, verbose=False, **kwargs):
+    if smiles.startswith("X"):
+        return 0, None, None
+    return len(smiles), f"name-{smiles}", f"desc-{smiles}"
+
+
+class TestDeltaRun(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.manifest = os.path.join(self.dir, "manifest.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_input(self, name, rows):
+        path = os.path.join(self.dir, name)
+        pd.DataFrame(rows, columns=["CID", "SMILES"]).to_csv(path, index=False)
+        return path
+
+    def _run(self, file_path, out_name, **kwargs):
+        out_path = os.path.join(self.dir, out_name)
+        with mock.patch.object(pubchem, "fetch_annotation_by_smiles", side_effect=_fake_fetch) as fetch:
+            pubchem.process_annotations(file_path, cid_name="CID", smiles_name="SMILES",
+                                        out_path=out_path, delay=0, manifest_path=self.manifest, **kwargs)
+        return out_path, [c.args[0] for c in fetch.call_args_list]
+
+    def test_second_version_fetches_only_delta(self):
+        v1 = self._write_input("v1.csv", [[1, "CCO"], [2, "CCN"], [3, "XCC"]])
+        out1, fetched1 = self._run(v1, "out_v1.csv")
+        self.assertEqual(sorted(fetched1), ["CCN", "CCO", "XCC"])
+
+        # CCN 的 CID 变了，CCC 是新增，XCC 上次无结果且未变化
+        v2 = self._write_input("v2.csv", [[1, "CCO"], [9, "CCN"], [3, "XCC"], [4, "CCC"]])
+        out2, fetched2 = self._run(v2, "out_v2.csv")
+        self.assertEqual(sorted(fetched2), ["CCC", "CCN"])
+
+        result = pd.read_csv(out2, encoding="utf-8-sig")
+        self.assertEqual(sorted(result["SMILES"]), ["CCC", "CCN", "CCO"])
+
+        manifest = RunManifest(self.manifest)
+        self.assertEqual(manifest.output, out2)
+        self.assertEqual(len(manifest.versions), 2)
+        self.assertEqual(manifest.outcome("XCC", row_fingerprint("XCC", 3)), MISS)
+        self.assertEqual(manifest.outcome("CCN", row_fingerprint("CCN", 9)), HIT)
+        self.assertIsNone(manifest.outcome("CCN", row_fingerprint("CCN", 2)))
+
+    def test_same_output_path_is_rebuilt(self):
+        v1 = self._write_input("v1.csv", [[1, "CCO"], [2, "CCN"], [3, "CCC"]])
+        self._run(v1, "out.csv")
+        # CCN 的 CID 变了，CCC 被删除，C=O 是新增
+        v2 = self._write_input("v2.csv", [[1, "CCO"], [9, "CCN"], [4, "C=O"]])
+        out, fetched = self._run(v2, "out.csv")
+        self.assertEqual(sorted(fetched), ["C=O", "CCN"])
+        result = pd.read_csv(out, encoding="utf-8-sig")
+        self.assertEqual(sorted(result["SMILES"]), ["C=O", "CCN", "CCO"])
+        self.assertFalse(os.path.exists(out + ".prev"))
+
+    def test_partial_run_keeps_other_entries(self):
+        v1 = self._write_input("v1.csv", [[1, "CCO"], [2, "CCN"], [3, "CCC"], [4, "XCC"]])
+        self._run(v1, "out.csv")
+        self.assertEqual(len(RunManifest(self.manifest).entries), 4)
+
+        # 只试跑 1 行：其它行的记录和结果都要保留
+        out, fetched = self._run(v1, "out.csv", max_rows=1)
+        self.assertEqual(fetched, [])
+        self.assertEqual(len(RunManifest(self.manifest).entries), 4)
+        self.assertEqual(len(pd.read_csv(out, encoding="utf-8-sig")), 3)
+
+        # 新版本只跑前 2 行：未跑到的变更行保留旧记录，下次仍会请求
+        v2 = self._write_input("v2.csv", [[1, "CCO"], [2, "CCN"], [8, "CCC"], [9, "CCS"]])
+        out, fetched = self._run(v2, "out.csv", max_rows=2)
+        self.assertEqual(fetched, [])
+        out, fetched = self._run(v2, "out.csv")
+        self.assertEqual(sorted(fetched), ["CCC", "CCS"])
+        self.assertEqual(sorted(pd.read_csv(out, encoding="utf-8-sig")["SMILES"]), ["CCC", "CCN", "CCO", "CCS"])
+
+    def test_unresolvable_smiles_recorded_as_miss(self):
+        v1 = self._write_input("v1.csv", [[1, "CCO"], [2, "BAD"], [3, "FLAKY"]])
+        out_path = os.path.join(self.dir, "out.csv")
+
+        def fake_post(url, data=None, **kwargs):
+            # BAD：PubChem 明确没有（404）；FLAKY：服务暂时不可用（503）
+            status = {"CCO": 200, "BAD": 404, "FLAKY": 503}[data]
+            return mock.Mock(status_code=status, text="702" if status == 200 else "Status: error")
+
+        posted = []
+        for _ in range(2):
+            with mock.patch.object(pubchem.requests, "post", side_effect=fake_post) as post, \
+                    mock.patch.object(pubchem, "fetch_annotation_by_cid", return_value=("ethanol", "d")):
+                pubchem.process_annotations(v1, cid_name="CID", smiles_name="SMILES", out_path=out_path,
+                                            delay=0, manifest_path=self.manifest)
+            posted.append(sorted(c.kwargs["data"] for c in post.call_args_list))
+        # 明确无 CID 的行记为 MISS 不再请求；请求失败的行下次重试
+        self.assertEqual(posted, [["BAD", "CCO", "FLAKY"], ["FLAKY"]])
+        self.assertEqual(RunManifest(self.manifest).outcome("BAD", row_fingerprint("BAD", 2)), MISS)
+
+
+if __name__ == '__main__':
+    unittest.main()
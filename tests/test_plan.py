@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import plan
+from src.manifest import RunManifest, row_fingerprint, HIT
+from src.plan import plan_run
+
+# SMILES -> CID；A 与 B 解析到同一 CID，Z 无法解析
+CIDS = {"A": "1", "B": "1", "C": "2", "Z": "Status: 404"}
+
+
+def _fake_post(url, data=None, **kwargs):
+    text = CIDS[data]
+    return mock.Mock(status_code=200 if text.isdigit() else 404, text=text, content=text.encode())
+
+
+def _fake_get(url, **kwargs):
+    body = b"x" * (100 if "synonyms" in url else 1000)
+    return mock.Mock(status_code=200, content=body)
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.input = os.path.join(self.dir, "input.csv")
+        pd.DataFrame({"Herb": ["h"] * 8,
+                      "SMILES": ["A", " A", "B", "C", "Z", "D", "E", '"C"']}).to_csv(self.input, index=False)
+        self.out = os.path.join(self.dir, "out.csv")
+        pd.DataFrame({"CID": [4], "SMILES": ["D"], "Name": ["d"], "Description": ["dd"]}).to_csv(self.out, index=False)
+        self.manifest = os.path.join(self.dir, "manifest.json")
+        m = RunManifest(self.manifest)
+        m.update({"E": [row_fingerprint("E"), HIT]}, self.input, self.out)
+        m.save()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_counts_probe_and_projection(self):
+        with mock.patch.object(plan.requests, "post", side_effect=_fake_post) as post, \
+                mock.patch.object(plan.requests, "get", side_effect=_fake_get) as get:
+            result = plan_run(self.input, smiles_name="SMILES", out_path=self.out, manifest_path=self.manifest,
+                              probe=10, delay=0.01, workers=1)
+        c = result["counts"]
+        self.assertEqual((c["rows"], c["unique"], c["in_output"], c["in_manifest"], c["remaining"]),
+                         (8, 6, 1, 1, 4))
+        # 4 行全部探测；A/B 共用 CID 1，只请求一次 CID 页面
+        self.assertEqual(post.call_count, 4)
+        self.assertEqual(get.call_count, 4)
+        self.assertEqual(result["probe"]["resolved"], 3)
+        self.assertEqual(result["expected_requests"], {"smiles_to_cid": 4, "synonyms": 2, "pug_view": 2})
+        self.assertEqual(result["expected_bytes"]["pug_view"], 2000)
+        self.assertAlmostEqual(result["probe"]["endpoints"]["smiles_to_cid"]["error_rate"], 0.25)
+        self.assertGreaterEqual(result["wall_seconds"], 4 * 0.01)
+
+    def test_no_probe_only_counts(self):
+        with mock.patch.object(plan.requests, "post") as post:
+            result = plan_run(self.input, smiles_name="SMILES", out_path=self.out, probe=0, delay=0.2, workers=4)
+        post.assert_not_called()
+        self.assertEqual(result["counts"]["remaining"], 5)
+        self.assertEqual(result["expected_requests"]["pug_view"], 0)
+        self.assertAlmostEqual(result["wall_seconds"], 5 * 0.2)
+
+    def test_wall_time_modes(self):
+        kwargs = dict(smiles_name="SMILES", out_path=self.out, probe=0, delay=0.2, workers=4)
+        # stream：所有请求共享一个 limiter；jobs：每个 worker 各自限速
+        self.assertAlmostEqual(plan_run(self.input, mode="stream", **kwargs)["wall_seconds"], 5 * 0.2)
+        self.assertAlmostEqual(plan_run(self.input, mode="jobs", **kwargs)["wall_seconds"], 5 * 0.2 / 4)
+        with self.assertRaises(ValueError):
+            plan_run(self.input, mode="threads", **kwargs)
+
+    def test_manifest_fingerprint_needs_matching_cid(self):
+        pd.DataFrame({"CID": [7], "SMILES": ["E"]}).to_csv(self.input, index=False)
+        m = RunManifest(self.manifest)
+        m.update({"E": [row_fingerprint("E", 7), HIT]}, self.input, self.out)
+        m.save()
+        without = plan_run(self.input, smiles_name="SMILES", out_path=self.out, manifest_path=self.manifest, probe=0)
+        self.assertEqual((without["counts"]["in_manifest"], without["counts"]["manifest_changed"]), (0, 1))
+        with_cid = plan_run(self.input, smiles_name="SMILES", cid_name="CID", out_path=self.out,
+                            manifest_path=self.manifest, probe=0)
+        self.assertEqual((with_cid["counts"]["in_manifest"], with_cid["counts"]["manifest_changed"]), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
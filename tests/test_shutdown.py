@@ -0,0 +1,90 @@
+import json
+import os
+import signal
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import pubchem
+
+
+class TestGracefulShutdown(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.file_path = os.path.join(self.dir, "in.csv")
+        pd.DataFrame({"CID": [1, 2, 3, 4], "SMILES": ["CCO", "CCN", "CCC", "C=O"]}).to_csv(self.file_path, index=False)
+        self.out_path = os.path.join(self.dir, "out.csv")
+        self.checkpoint = os.path.join(self.dir, "state.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _run(self, fake_fetch, grace=5):
+        with mock.patch.object(pubchem, "fetch_annotation_by_smiles", side_effect=fake_fetch) as fetch:
+            pubchem.process_annotations(self.file_path, cid_name="CID", smiles_name="SMILES",
+                                        out_path=self.out_path, delay=0, save_every=100,
+                                        checkpoint_path=self.checkpoint, grace_period=grace)
+        with open(self.checkpoint, encoding="utf-8") as f:
+            state = json.load(f)["current_state"]
+        return fetch.call_count, pd.read_csv(self.out_path, encoding="utf-8-sig"), state
+
+    def test_sigterm_drains_in_flight_and_flushes(self):
+        def fake_fetch(smiles, **kwargs):
+            if smiles == "CCN":
+                os.kill(os.getpid(), signal.SIGTERM)
+            return 1, smiles, "d"
+
+        calls, out, state = self._run(fake_fetch)
+        # 在途的 CCN 完成并写盘，之后不再派发
+        self.assertEqual(calls, 2)
+        self.assertEqual(out["SMILES"].tolist(), ["CCO", "CCN"])
+        self.assertTrue(state["interrupted"])
+        self.assertEqual(state["next_batch_start"], 2)
+
+    def test_grace_period_expiry_aborts_request(self):
+        def fake_fetch(smiles, **kwargs):
+            if smiles == "CCN":
+                os.kill(os.getpid(), signal.SIGINT)
+                time.sleep(10)
+            return 1, smiles, "d"
+
+        start = time.monotonic()
+        calls, out, state = self._run(fake_fetch, grace=0.2)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(out["SMILES"].tolist(), ["CCO"])
+        self.assertEqual(state["next_batch_start"], 1)
+        self.assertIs(signal.getsignal(signal.SIGINT), signal.default_int_handler)
+
+    def test_second_signal_during_final_flush_is_deferred(self):
+        def fake_fetch(smiles, **kwargs):
+            if smiles == "CCN":
+                os.kill(os.getpid(), signal.SIGTERM)
+            return 1, smiles, "d"
+
+        append = pubchem._append_df_to_csv
+
+        def interrupted_append(*args, **kwargs):
+            os.kill(os.getpid(), signal.SIGINT)
+            return append(*args, **kwargs)
+
+        with mock.patch.object(pubchem, "_append_df_to_csv", side_effect=interrupted_append):
+            calls, out, state = self._run(fake_fetch)
+        # 写盘期间的第二次信号不会打断写出缓冲区和 checkpoint
+        self.assertEqual(out["SMILES"].tolist(), ["CCO", "CCN"])
+        self.assertFalse(state["is_running"])
+        self.assertEqual(state["next_batch_start"], 2)
+
+    def test_checkpoint_directory_is_created(self):
+        self.checkpoint = os.path.join(self.dir, "checkpoints", "state.json")
+        calls, out, state = self._run(lambda smiles, **kwargs: (1, smiles, "d"))
+        self.assertEqual(calls, 4)
+        self.assertFalse(state["is_running"])
+
+
+if __name__ == '__main__':
+    unittest.main()